@@ -1,23 +1,207 @@
-if __name__ == "__main__":
-    import argparse
-    import os
-    import pandas as pd
-    from .utils import label_data, make_roc_curve, plot_roc_curve
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from .bootstrap import roc_intervals
+from .readers import read_header, read_tsv
+from .utils import label_data, make_roc_curve, plot_roc_curve
+
+# ROC tables of tsv files as <input name>.<column>.roc.tsv, for one file and column
+# or for many files, globs and columns in one run. Files are spread over a process
+# pool, and only the requested columns are read from each file and processed.
+
+
+def expand_inputs(patterns):
+    # the files of every path or glob pattern, in order and without duplicates; the
+    # patterns that match nothing are returned too. Globs skip the roc tables written
+    # by earlier runs, so *.tsv can be run again in the same folder
+    files = []
+    unmatched = []
+    for pattern in patterns:
+        if any(char in pattern for char in "*?["):
+            matches = sorted(
+                path for path in glob.glob(pattern) if not path.endswith(".roc.tsv")
+            )
+        else:
+            matches = [pattern] if os.path.isfile(pattern) else []
+        if not matches:
+            unmatched.append(pattern)
+        files.extend(match for match in matches if match not in files)
+    return files, unmatched
+
+
+def output_path(input_file, column, output_dir=None):
+    # next to the input file unless an output folder is given
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    folder = output_dir if output_dir is not None else os.path.dirname(input_file)
+    return os.path.join(folder, stem + "." + column + ".roc.tsv")
+
+
+def roc_table(labeled_column, roc_column, bootstrap=0, seed=0, max_workers=None):
+    # roc table of one column, with the TPR and TNR intervals when bootstrapped;
+    # returns (table, intervals), table is None without labeled samples
+    # plot_roc_curve already emits one point per distinct threshold
+    _, df_output, mirrored = plot_roc_curve(roc_column, 0, True)
+    if df_output is None:
+        return None, None
+
+    intervals = None
+    if bootstrap > 0:
+        intervals = roc_intervals(
+            labeled_column["positive"]["data"],
+            labeled_column["negative"]["data"],
+            mirrored,
+            replicates=bootstrap,
+            seed=seed,
+            max_workers=max_workers,
+        )
+    if intervals and "sensitivity" in intervals:
+        # same roc points, in the same order, as plot_roc_curve
+        df_output["TPR_low"] = intervals["sensitivity_low"]
+        df_output["TPR_high"] = intervals["sensitivity_high"]
+        df_output["TNR_low"] = intervals["specificity_low"]
+        df_output["TNR_high"] = intervals["specificity_high"]
+    return df_output, intervals
+
 
-    parser = argparse.ArgumentParser(description="get roc curve as tsv file, input file must have 'reference_result' column, and must specify column as argument")
-    parser.add_argument("input_file", help="tsv file with 'reference_result' column")
-    parser.add_argument("column", help="name of column you want to get roc curve of")
-    args=parser.parse_args()
+def process_file(input_file, columns=None, output_dir=None, bootstrap=0, seed=0, max_workers=None):
+    # writes the roc tables of the requested columns of one file, every numeric column
+    # when columns is None; returns ([(column, output file, table, intervals)], errors)
+    if columns is None:
+        df_input = read_tsv(input_file)
+    else:
+        header = read_header(input_file)
+        wanted = ["reference_result"] + [column for column in columns if column != "reference_result"]
+        df_input = read_tsv(input_file, columns=[column for column in wanted if column in header])
+    if "reference_result" not in df_input.columns:
+        return [], [f"{input_file}: no 'reference_result' column"]
 
-    df_input = pd.read_csv(args.input_file, sep="\t")
     labeled_data = label_data(df_input)
     roc_curves = make_roc_curve(labeled_data)
-    roc_column = roc_curves.get(args.column)
 
-    _, df_roc, mirrored = plot_roc_curve(roc_column, 0, True)
+    results = []
+    errors = []
+    for column in columns if columns is not None else list(labeled_data):
+        if column not in roc_curves:
+            errors.append(f"{input_file}: no numeric column '{column}'")
+            continue
+        df_output, intervals = roc_table(
+            labeled_data[column], roc_curves[column], bootstrap, seed, max_workers
+        )
+        if df_output is None:
+            errors.append(f"{input_file}: no labeled samples in column '{column}'")
+            continue
+        if df_input[column].dtype.kind in "iu":
+            # the roc arrays are float, thresholds of integer columns are written as
+            # the integers they are
+            df_output["threshold"] = df_output["threshold"].astype(df_input[column].dtype)
+        output_file = output_path(input_file, column, output_dir)
+        df_output.to_csv(output_file, sep="\t", index=None)
+        results.append((column, output_file, df_output, intervals))
+    return results, errors
 
-    df_output = df_roc.drop_duplicates(subset=["TNR(x)", "TPR(y)"], keep="last")
 
-    output_file = os.path.splitext(args.input_file)[0]+"."+args.column+".roc"+".tsv"
-    df_output.to_csv(output_file, sep="\t", index=None)
-    print(df_output.to_string(index=False))
+def interval_text(intervals):
+    return (
+        f"AUC {intervals['auc']:.3f} ({intervals['level']:.0%} CI "
+        f"{intervals['auc_low']:.3f}-{intervals['auc_high']:.3f}, "
+        f"{intervals['replicates']} bootstrap replicates, seed {intervals['seed']})"
+    )
+
+
+def _process_file(input_file, columns, output_dir, bootstrap, seed, max_workers, tables=True):
+    # process_file that reports a failing file instead of raising; without tables
+    # only the output files and AUC lines come back, not whole tables from the pool
+    try:
+        results, errors = process_file(
+            input_file, columns, output_dir, bootstrap, seed, max_workers
+        )
+    except Exception as e:
+        return [], [f"{input_file}: {e}"]
+    if not tables:
+        results = [
+            (column, output_file, None, intervals and interval_text(intervals))
+            for column, output_file, _, intervals in results
+        ]
+    return results, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="get roc curves as tsv files, input files must have 'reference_result' column. "
+        "Either one input file and one column, or any number of files and glob patterns with --columns "
+        "(every numeric column without it)"
+    )
+    parser.add_argument("inputs", nargs="+", metavar="input_file", help="tsv files with 'reference_result' column, or glob patterns of them")
+    parser.add_argument("--columns", nargs="+", metavar="COLUMN", help="names of the columns you want to get roc curves of, every numeric column by default")
+    parser.add_argument("--output-dir", help="folder of the roc tsv files, next to each input file by default")
+    parser.add_argument("--workers", type=int, default=None, help="files processed at the same time, every core by default")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="REPLICATES", help="add 95%% bootstrap confidence intervals of TPR, TNR and AUC from this many replicates")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the bootstrap resampling")
+    args = parser.parse_args(argv)
+
+    inputs = args.inputs
+    columns = args.columns
+    if (
+        columns is None
+        and len(inputs) == 2
+        and not os.path.exists(inputs[1])
+        and not any(char in inputs[1] for char in "*?[")
+    ):
+        # the single file form: input_file column
+        inputs, columns = inputs[:1], inputs[1:]
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    input_files, unmatched = expand_inputs(inputs)
+    errors = [f"{pattern}: no such file" for pattern in unmatched]
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+        stems = [os.path.splitext(os.path.basename(path))[0] for path in input_files]
+        duplicates = sorted({stem for stem in stems if stems.count(stem) > 1})
+        if duplicates:
+            parser.error(f"input files with the same name would overwrite each other's output: {', '.join(duplicates)}")
+
+    if len(input_files) <= 1 or args.workers == 1:
+        # bootstrap batches may still use the cores
+        outcomes = [
+            _process_file(path, columns, args.output_dir, args.bootstrap, args.seed, args.workers)
+            for path in input_files
+        ]
+    else:
+        # the files already use the cores, so each bootstraps in its own process
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            outcomes = list(
+                executor.map(
+                    _process_file,
+                    input_files,
+                    [columns] * len(input_files),
+                    [args.output_dir] * len(input_files),
+                    [args.bootstrap] * len(input_files),
+                    [args.seed] * len(input_files),
+                    [1] * len(input_files),
+                    [False] * len(input_files),
+                )
+            )
+
+    results = [result for file_results, _ in outcomes for result in file_results]
+    errors += [error for _, file_errors in outcomes for error in file_errors]
+    if len(results) == 1 and not errors:
+        _, _, df_output, intervals = results[0]
+        print(df_output.to_string(index=False))
+        if intervals:
+            print(interval_text(intervals))
+    else:
+        for _, output_file, _, intervals in results:
+            if isinstance(intervals, dict):
+                intervals = interval_text(intervals)
+            print(output_file + (": " + intervals if intervals else ""))
+    for error in errors:
+        print(error, file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
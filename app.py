@@ -8,6 +8,8 @@ from dash import (
     State,
     ctx,
     ALL,
+    ClientsideFunction,
+    Patch,
     no_update,
     dcc,
     page_container,
@@ -16,12 +18,17 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
 import pandas as pd
-from scipy import stats
 import base64
-import pickle
-import io
 import os
 import shutil
+from functools import lru_cache
+import bootstrap
+import dataset_cache
+import grid_source
+import jobs
+import leaderboard
+import readers
+import storage
 import utils
 
 import dash_bootstrap_components as dbc
@@ -39,15 +46,31 @@ NEGATIVE = "#446e9b"
 UNKNOWN = "#999"
 THRESHOLD = "#d47500"
 
-SAVED_FILE_NAMES = {
-    "roc curves": "roc_curves.pkl",
-    "raw data": "raw_data.feather",
-    "labeled data": "labeled_data.pkl",
-    "parameter fitting": "fitted_params.pkl",
-}
-
 DATA_FOLDER = "data"
 
+# worker processes for distribution fitting, None uses every core, 1 fits serially
+FIT_WORKERS = None
+
+# content-addressed cache of fitted parameters shared by every dataset
+FIT_CACHE_FOLDER = os.path.join(DATA_FOLDER, ".fit_cache")
+
+# skip fitting at upload, fits are computed when a plot or table first needs them
+LAZY_FITS = True
+
+# seed fits with moment estimates and fit large groups on a subsample first
+FAST_FITS = False
+
+# milliseconds between job progress updates while uploads are being processed
+JOB_POLL_INTERVAL = 1000
+
+# move the threshold in the browser (assets/threshold.js): the roc table, roc marker
+# and main graph vline follow the slider without a request to the server; when off,
+# the server answers each move with small patches of the two figures
+CLIENTSIDE_THRESHOLD = True
+
+# bootstrap replicates behind the confidence intervals in the roc table, 0 hides them
+ROC_CI_REPLICATES = 1000
+
 app = Dash(
     __name__,
     external_stylesheets=[
@@ -125,12 +148,19 @@ app.layout = html.Div(
         html.Div(id="loadup-dummy"),
         dcc.Store(id="uploaded-files-list", data=[], storage_type="memory"),
         dcc.Store(id="processed-files-list", data=[], storage_type="memory"),
-        dcc.Store(id="raw-data-for-grid", data={}, storage_type="memory"),
-        dcc.Store(id="labeled-data", data={}, storage_type="memory"),
-        dcc.Store(id="fit-params", data={}, storage_type="memory"),
-        dcc.Store(id="roc-curves", data={}, storage_type="memory"),
+        # name of the selected dataset, its arrays stay server side in dataset_cache
+        dcc.Store(id="dataset-key", data=None, storage_type="memory"),
+        # dataset the file dropdown should show, set when a job finishes; the dropdown
+        # is only in the layout of the analysis page
+        dcc.Store(id="selected-file", data=None, storage_type="memory"),
         dcc.Store(id="range-value", data=[None, None], storage_type="memory"),
+        # what the main graph was built for and where its patched parts are
         dcc.Store(id="graph-cache", data={}, storage_type="memory"),
+        # sorted values and counts of the selected column, see utils.threshold_arrays
+        dcc.Store(id="threshold-arrays", data=None, storage_type="memory"),
+        # uploads are processed by background jobs, polled while any is running
+        dcc.Store(id="jobs-status", data=[], storage_type="memory"),
+        dcc.Interval(id="job-poll", interval=JOB_POLL_INTERVAL, disabled=False),
         navbar,
         alert_fail,
         alert_warning,
@@ -139,6 +169,41 @@ app.layout = html.Div(
 )
 
 
+def validate_upload(decoded, filename):
+    # (DataFrame or None, errors, warnings) of an uploaded tsv
+    errors = []
+    warnings = []
+    df_file = None
+    try:
+        if filename.endswith(".tsv"):
+            # parsed straight from the bytes, this is the only parse of the file
+            df_file = readers.read_tsv(decoded)
+        else:
+            errors.append(
+                f"The filetype of {filename} is incorrect. Please upload a .tsv file."
+            )
+            return None, errors, warnings
+
+        # Check for required Column
+        if "reference_result" not in df_file.columns:
+            warnings.append(f"Warning: No Column 'reference_result' in {filename}")
+        else:
+            if (
+                not df_file["reference_result"]
+                .isin({float(-1), float(0), float(1), np.nan})
+                .all()
+            ):
+                errors.append(
+                    f"Error: The column 'reference_result' in file {filename} has incorrect values, must be -1, 0, 1, or be empty."
+                )
+
+    except pd.errors.EmptyDataError:
+        errors.append(f"Error: The file {filename} is empty.")
+    except Exception as e:
+        errors.append(f"An unexpected Error occured: {e}")
+    return df_file, errors, warnings
+
+
 @callback(
     Output("uploaded-files-list", "data", allow_duplicate=True),
     Output("alert-fail", "is_open", allow_duplicate=True),
@@ -164,36 +229,11 @@ def store_files(upload_contents, upload_filenames, uploaded_files_list):
             except base64.binascii.Error as e:
                 errors.append(f"Error decoding Base64 string of file {filename}: {e}")
 
-            try:
-                if filename.endswith(".tsv"):
-                    df_file = pd.read_csv(
-                        io.StringIO(decoded.decode("utf-8")), sep="\t"
-                    )
-                else:
-                    errors.append(
-                        f"The filetype of {filename} is incorrect. Please upload a .tsv file."
-                    )
-                    continue
-
-                # Check for required Column
-                if "reference_result" not in df_file.columns:
-                    warnings.append(
-                        f"Warning: No Column 'reference_result' in {filename}"
-                    )
-                else:
-                    if (
-                        not df_file["reference_result"]
-                        .isin({float(-1), float(0), float(1), np.nan})
-                        .all()
-                    ):
-                        errors.append(
-                            f"Error: The column 'reference_result' in file {filename} has incorrect values, must be -1, 0, 1, or be empty."
-                        )
-
-            except pd.errors.EmptyDataError:
-                errors.append(f"Error: The file {filename} is empty.")
-            except Exception as e:
-                errors.append(f"An unexpected Error occured: {e}")
+            df_file, file_errors, file_warnings = validate_upload(decoded, filename)
+            errors.extend(file_errors)
+            warnings.extend(file_warnings)
+            if not filename.endswith(".tsv"):
+                continue
 
             # If no errors, file is acceptable and save to /data/filename/
             file_dir = os.path.join("data", filename)
@@ -201,9 +241,16 @@ def store_files(upload_contents, upload_filenames, uploaded_files_list):
                 os.makedirs(file_dir, exist_ok=True)
                 output_filepath = os.path.join(file_dir, filename)
 
+                if storage.is_processed(file_dir):
+                    # same name as a processed file, the upload replaces it
+                    storage.discard_processed(file_dir)
+                    dataset_cache.invalidate(DATA_FOLDER, filename)
+
                 try:
                     with open(output_filepath, "wb") as file:
                         file.write(decoded)
+                    # data_processing picks the parsed frame up from here
+                    storage.write_raw_data(file_dir, df_file)
                     all_uploaded_files_list.append(filename)
                 except IOError as e:
                     errors.append(f"Error saving file {filename}: {e}")
@@ -232,150 +279,207 @@ def store_files(upload_contents, upload_filenames, uploaded_files_list):
     )
 
 
-# TODO: when files with same filename are uploaded they do not replace the existing file
+def job_fit_options(fit_workers=FIT_WORKERS):
+    return {
+        "lazy": LAZY_FITS,
+        "max_workers": fit_workers,
+        "cache_dir": FIT_CACHE_FOLDER,
+        "fast": FAST_FITS,
+    }
+
+
 @callback(
-    Output("processed-files-list", "data", allow_duplicate=True),
-    Output("labeled-data", "data", allow_duplicate=True),
-    Output("roc-curves", "data", allow_duplicate=True),
-    Output("fit-params", "data", allow_duplicate=True),
-    Output("raw-data-for-grid", "data", allow_duplicate=True),
-    Output("alert-fail", "is_open", allow_duplicate=True),
-    Output("alert-fail", "children", allow_duplicate=True),
+    Output("job-poll", "disabled", allow_duplicate=True),
     Input("uploaded-files-list", "data"),
-    State("processed-files-list", "data"),
     prevent_initial_call=True,
 )
-def data_processing(uploaded_files_list, processed_files_list):
-    errors = []
+def data_processing(uploaded_files_list):
+    # queue the uploads that aren't processed yet, job-poll picks the results up
     if not uploaded_files_list:
-        return (
-            no_update,
-            no_update,
-            no_update,
-            no_update,
-            no_update,
-            no_update,
-            no_update,
-        )
+        return no_update
 
-    new_labeled_data = {}
-    new_roc_curves = {}
-    new_fit_params = {}
-    new_raw_data_for_grid = {}
-    last_processed_file = None
+    queued_files = [
+        job["filename"]
+        for job in jobs.list_jobs(DATA_FOLDER)
+        if job["status"] in jobs.ACTIVE_STATUSES
+    ]
+    # a file uploaded again under the same name was discarded by store_files
+    new_files = [
+        filename
+        for filename in dict.fromkeys(uploaded_files_list)
+        if filename not in queued_files
+        and os.path.isdir(os.path.join(DATA_FOLDER, filename))
+        and not storage.is_processed(os.path.join(DATA_FOLDER, filename))
+    ]
+    if not new_files:
+        return no_update
+
+    # the files of a batch are processed in parallel, so they share the cores
+    # their fits can use instead of each starting a pool of every core
+    fit_workers = FIT_WORKERS
+    if fit_workers is None and len(new_files) > 1:
+        fit_workers = max(1, (os.cpu_count() or 1) // len(new_files))
+
+    # largest first, so the batch takes about as long as its slowest file
+    new_files.sort(
+        key=lambda filename: os.path.getsize(os.path.join(DATA_FOLDER, filename, filename)),
+        reverse=True,
+    )
+    for filename in new_files:
+        jobs.submit(DATA_FOLDER, filename, job_fit_options(fit_workers))
 
-    finished_processed_files_list = processed_files_list if processed_files_list else []
+    return False
 
-    for filename in uploaded_files_list:
-        if filename not in finished_processed_files_list:
-            try:
-                file_dir = os.path.join("data", filename)
-                raw_file_path = os.path.join(file_dir, filename)
 
-                if filename.endswith(".tsv"):
-                    df = pd.read_csv(raw_file_path, sep="\t")
+@callback(
+    Output("job-poll", "disabled", allow_duplicate=True),
+    Output("append-data", "contents"),
+    Output("alert-fail", "is_open", allow_duplicate=True),
+    Output("alert-fail", "children", allow_duplicate=True),
+    Output("alert-warning", "is_open", allow_duplicate=True),
+    Output("alert-warning", "children", allow_duplicate=True),
+    Input("append-data", "contents"),
+    State("append-data", "filename"),
+    State("append-target", "value"),
+    prevent_initial_call=True,
+)
+def append_rows(content, filename, target):
+    # queue adding the rows of an uploaded tsv to the processed file target
+    if not content:
+        return no_update, no_update, no_update, no_update, no_update, no_update
 
-                labeled_data = utils.label_data(df)
-                roc_curves = utils.make_roc_curve(labeled_data)
-                fitted_params = utils.fit_params(labeled_data)
+    errors = []
+    warnings = []
+    if not target:
+        errors.append("Select the file to append the rows to.")
+    elif any(
+        job["filename"] == target and job["status"] in jobs.ACTIVE_STATUSES
+        for job in jobs.list_jobs(DATA_FOLDER)
+    ):
+        errors.append(f"{target} is still being processed, try again when it is done.")
+    else:
+        content_type, content_string = content.split(",")
+        try:
+            decoded = base64.b64decode(content_string)
+        except base64.binascii.Error as e:
+            decoded = None
+            errors.append(f"Error decoding Base64 string of file {filename}: {e}")
+        if decoded is not None:
+            _, errors, warnings = validate_upload(decoded, filename)
+
+    if not errors:
+        rows_path = os.path.join(
+            DATA_FOLDER, target, f".append-{os.urandom(8).hex()}.tsv"
+        )
+        with open(rows_path, "wb") as file:
+            file.write(decoded)
+        jobs.submit(DATA_FOLDER, target, job_fit_options(), rows_path=rows_path)
 
-                labeled_data_filepath = os.path.join(
-                    file_dir, SAVED_FILE_NAMES["labeled data"]
-                )
-                with open(labeled_data_filepath, "wb") as f:
-                    pickle.dump(labeled_data, f)
-                roc_curves_filepath = os.path.join(
-                    file_dir, SAVED_FILE_NAMES["roc curves"]
-                )
-                with open(roc_curves_filepath, "wb") as f:
-                    pickle.dump(roc_curves, f)
-                fitted_params_filepath = os.path.join(
-                    file_dir, SAVED_FILE_NAMES["parameter fitting"]
-                )
-                with open(fitted_params_filepath, "wb") as f:
-                    pickle.dump(fitted_params, f)
+    return (
+        False if not errors else no_update,
+        None,
+        len(errors) > 0,
+        html.Ul([html.Li(msg) for msg in errors]) if errors else "",
+        len(warnings) > 0,
+        html.Ul([html.Li(msg) for msg in warnings]) if warnings else "",
+    )
 
-                raw_grid_filepath = os.path.join(file_dir, SAVED_FILE_NAMES["raw data"])
-                df.to_feather(raw_grid_filepath)
 
-                new_labeled_data[filename] = labeled_data
-                new_roc_curves[filename] = roc_curves
-                new_fit_params[filename] = fitted_params
-                new_raw_data_for_grid[filename] = df.to_dict("records")
+_jobs_resumed = False
 
-                finished_processed_files_list.append(filename)
-                last_processed_file = filename
 
-            except Exception as e:
-                errors.append(f"Error processing file {filename}: {e}")
-                if os.path.exists(filename):
-                    try:
-                        shutil.rmtree(filename)
-                    except OSError as e:
-                        errors.append(f"Error: {filename} - {e.strerror}.")
+@callback(
+    Output("processed-files-list", "data", allow_duplicate=True),
+    Output("dataset-key", "data", allow_duplicate=True),
+    Output("selected-file", "data"),
+    Output("alert-fail", "is_open", allow_duplicate=True),
+    Output("alert-fail", "children", allow_duplicate=True),
+    Output("jobs-status", "data"),
+    Output("job-poll", "disabled"),
+    Input("job-poll", "n_intervals"),
+    State("processed-files-list", "data"),
+    prevent_initial_call=True,
+)
+def poll_jobs(n_intervals, processed_files_list):
+    global _jobs_resumed
+    if not _jobs_resumed:
+        # jobs left behind by a previous run of the server
+        _jobs_resumed = True
+        jobs.resume(DATA_FOLDER)
 
-    # Logic for alerts
-    fail_is_open = len(errors) > 0
-    fail_children = html.Ul([html.Li(msg) for msg in errors]) if errors else ""
     errors = []
+    last_processed_file = None
+    finished_processed_files_list = list(processed_files_list or [])
+    active_jobs = []
+
+    for job in jobs.list_jobs(DATA_FOLDER):
+        if job["status"] in jobs.ACTIVE_STATUSES:
+            active_jobs.append(job)
+            continue
+
+        if job["status"] == "done":
+            dataset_cache.invalidate(DATA_FOLDER, job["filename"])
+            if job["filename"] not in finished_processed_files_list:
+                finished_processed_files_list.append(job["filename"])
+            # a new upload or the dataset rows were appended to
+            last_processed_file = job["filename"]
+        elif job["status"] == "failed":
+            errors.append(job["error"])
+        jobs.forget(DATA_FOLDER, job["id"])
+
+    jobs_status = [
+        {
+            "id": job["id"],
+            "filename": job["filename"],
+            "append": bool(job.get("rows_path")),
+            "status": job["status"],
+            "stage": job["stage"],
+            "progress": job["progress"],
+        }
+        for job in active_jobs
+    ]
+    poll_disabled = not active_jobs
+
+    # Logic for alerts
+    fail_is_open = True if errors else no_update
+    fail_children = html.Ul([html.Li(msg) for msg in errors]) if errors else no_update
 
     if last_processed_file:
+        files_changed = finished_processed_files_list != (processed_files_list or [])
         return (
-            finished_processed_files_list,
-            new_labeled_data.get(last_processed_file, {}),
-            new_roc_curves.get(last_processed_file, {}),
-            new_fit_params.get(last_processed_file, {}),
-            new_raw_data_for_grid.get(last_processed_file, {}),
+            finished_processed_files_list if files_changed else no_update,
+            last_processed_file,
+            last_processed_file,
             fail_is_open,
             fail_children,
+            jobs_status,
+            poll_disabled,
         )
 
     return (
-        no_update,
-        no_update,
         no_update,
         no_update,
         no_update,
         fail_is_open,
         fail_children,
+        jobs_status,
+        poll_disabled,
     )
 
 
 @app.callback(
-    Output("labeled-data", "data"),
-    Output("fit-params", "data"),
-    Output("roc-curves", "data"),
-    Output("raw-data-for-grid", "data"),
+    Output("dataset-key", "data"),
     Input("file-select", "value"),
     prevent_initial_call=True,
 )
 def load_data_into_stores(file_select_value):
     if file_select_value is None:
-        return no_update, no_update, no_update, no_update
-
-    file_dir = os.path.join("data", file_select_value)
-
-    # Load labeled data from pickle
-    labeled_data_path = os.path.join(file_dir, "labeled_data.pkl")
-    with open(labeled_data_path, "rb") as f:
-        labeled_data = pickle.load(f)
-
-    # Load fitted params from pickle
-    fit_params_path = os.path.join(file_dir, "fitted_params.pkl")
-    with open(fit_params_path, "rb") as f:
-        fit_params = pickle.load(f)
-
-    # Load ROC curve data from pickle
-    roc_curves_path = os.path.join(file_dir, "roc_curves.pkl")
-    with open(roc_curves_path, "rb") as f:
-        roc_curves = pickle.load(f)
-
-    # Load raw data from feather and convert to dict for AG Grid
-    raw_data_path = os.path.join(file_dir, "raw_data.feather")
-    raw_data_df = pd.read_feather(raw_data_path)
-    raw_data_for_grid = raw_data_df.to_dict("records")
+        return no_update
 
-    return labeled_data, fit_params, roc_curves, raw_data_for_grid
+    # Memory-mapped arrays, pickle folders are migrated on first load
+    if dataset_cache.get(DATA_FOLDER, file_select_value) is None:
+        return None
+    return file_select_value
 
 
 # Sliders #
@@ -389,12 +493,14 @@ def load_data_into_stores(file_select_value):
     Input("column-select", "value"),
     Input("range-reset", "n_clicks"),
     State("range-slider", "value"),
-    State("labeled-data", "data"),
+    State("dataset-key", "data"),
     prevent_initial_call=False,
 )
-def reset_range_slider(selected_column, n_clicks, rangeslider_value, labeled_data):
-    if not selected_column:
+def reset_range_slider(selected_column, n_clicks, rangeslider_value, dataset_key):
+    dataset = dataset_cache.get(DATA_FOLDER, dataset_key)
+    if not selected_column or dataset is None:
         raise dash.exceptions.PreventUpdate
+    labeled_data = dataset["labeled_data"]
 
     range_min = labeled_data.get(selected_column, {}).get("range_min", 0)
     range_max = labeled_data.get(selected_column, {}).get("range_max", 0)
@@ -445,29 +551,90 @@ no_fig.add_annotation(
 )
 no_fig.update_layout(xaxis={"visible": False}, yaxis={"visible": False})
 
+# index of the "Threshold Point" trace in utils.plot_roc_curve
+ROC_MARKER_TRACE = 1
+
+
+@lru_cache(maxsize=16)
+def _roc_intervals(dataset_key, version, selected_column):
+    # bootstrap.roc_intervals of a column, computed once per dataset version
+    dataset = dataset_cache.get(DATA_FOLDER, dataset_key)
+    column_data = dataset["labeled_data"][selected_column]
+    return bootstrap.roc_intervals(
+        column_data["positive"]["data"],
+        column_data["negative"]["data"],
+        dataset["roc_curves"][selected_column]["mirrored"],
+        replicates=ROC_CI_REPLICATES,
+        max_workers=FIT_WORKERS,
+    )
+
+
+def roc_intervals(dataset, dataset_key, selected_column):
+    if not ROC_CI_REPLICATES:
+        return None
+    return _roc_intervals(dataset_key, dataset["version"], selected_column)
+
+
+def _interval_text(low, high):
+    return f"{round(low, 2):.2f} – {round(high, 2):.2f}"
+
+
+def add_interval_rows(table_data, intervals, threshold):
+    # the roc table row as the estimate, with the AUC, and a row of intervals; the
+    # same rows are built by assets/threshold.js
+    if not intervals:
+        return table_data
+    estimate = dict(table_data[0], row="Estimate", AUC=round(intervals["auc"], 2))
+    interval = {
+        "row": f"{intervals['level']:.0%} CI",
+        "AUC": _interval_text(intervals["auc_low"], intervals["auc_high"]),
+    }
+    if "sensitivity" in intervals:
+        point = int(np.searchsorted(intervals["thresholds"], threshold, side="left"))
+        interval["Sensitivity (TPR)"] = _interval_text(
+            intervals["sensitivity_low"][point], intervals["sensitivity_high"][point]
+        )
+        interval["Specificity (TNR)"] = _interval_text(
+            intervals["specificity_low"][point], intervals["specificity_high"][point]
+        )
+    return [estimate, interval]
+
 
 @app.callback(
     Output("roc_plot", "figure"),
     Output("roc-table", "data"),
     Output("roc-table", "columns"),
+    Output("threshold-arrays", "data"),
     Input("column-select", "value"),
-    Input("slider-position", "value"),
-    State("fit-params", "data"),
-    State("roc-curves", "data"),
+    # the threshold is moved by patches, see CLIENTSIDE_THRESHOLD
+    State("slider-position", "value"),
+    State("dataset-key", "data"),
     prevent_inital_call=False,
 )
-def update_roc_plot_and_table(selected_column, pos_x, fitted_params, roc_curves):
-    if not roc_curves or not selected_column:
-        return no_fig, None, None
-
-    roc_column = roc_curves.get(selected_column)
-
-    # Check if roc_column and its population_data are available and not empty
-    if not roc_column or not roc_column.get("population_data"):
-        return no_fig, None, None
+def update_roc_plot_and_table(selected_column, pos_x, dataset_key):
+    dataset = dataset_cache.get(DATA_FOLDER, dataset_key)
+    if dataset is None or not selected_column:
+        return no_fig, None, None, None
+
+    labeled_data = dataset["labeled_data"]
+    fitted_params = dataset["fitted_params"]
+    roc_column = dataset["roc_curves"].get(selected_column)
+
+    # Check if roc_column and its values are available and not empty
+    if not roc_column or len(roc_column.get("values", [])) == 0:
+        return no_fig, None, None, None
     else:
+        norm_params = utils.get_fit(
+            labeled_data,
+            fitted_params,
+            selected_column,
+            "positive",
+            "norm",
+            cache_dir=FIT_CACHE_FOLDER,
+            fast=FAST_FITS,
+        )
         ROCDataTable_data, ROCDataTable_columns, roc_index = utils.gen_roc_table(
-            roc_column, pos_x, fitted_params[selected_column]["positive"]["norm"]
+            roc_column, pos_x, norm_params
         )
         roc_fig, df_roc, mirrored = utils.plot_roc_curve(roc_column, roc_index, False)
         roc_fig.update_layout(
@@ -479,7 +646,45 @@ def update_roc_plot_and_table(selected_column, pos_x, fitted_params, roc_curves)
             # margin=dict(l=10, r=10, t=10, b=10), width=525  # Reduce overall margins
             dragmode=False,
         )
-    return roc_fig, ROCDataTable_data, ROCDataTable_columns
+        intervals = roc_intervals(dataset, dataset_key, selected_column)
+        if intervals:
+            ROCDataTable_data = add_interval_rows(ROCDataTable_data, intervals, pos_x)
+            ROCDataTable_columns = [
+                {"name": "", "id": "row"},
+                *ROCDataTable_columns,
+                {"name": "AUC", "id": "AUC"},
+            ]
+
+    threshold_arrays = None
+    if CLIENTSIDE_THRESHOLD:
+        threshold_arrays = utils.threshold_arrays(roc_column, norm_params)
+        if threshold_arrays and intervals:
+            threshold_arrays["intervals"] = {
+                name: value.tolist() if isinstance(value, np.ndarray) else value
+                for name, value in intervals.items()
+            }
+    return roc_fig, ROCDataTable_data, ROCDataTable_columns, threshold_arrays
+
+
+if CLIENTSIDE_THRESHOLD:
+    app.clientside_callback(
+        ClientsideFunction(namespace="threshold", function_name="update_roc"),
+        Output("roc_plot", "figure", allow_duplicate=True),
+        Output("roc-table", "data", allow_duplicate=True),
+        Input("slider-position", "value"),
+        State("threshold-arrays", "data"),
+        State("roc_plot", "figure"),
+        prevent_initial_call=True,
+    )
+
+    app.clientside_callback(
+        ClientsideFunction(namespace="threshold", function_name="move_vline"),
+        Output("graph", "figure", allow_duplicate=True),
+        Input("slider-position", "value"),
+        State("range-slider", "value"),
+        State("graph", "figure"),
+        prevent_initial_call=True,
+    )
 
 
 @app.callback(
@@ -497,26 +702,112 @@ def set_threshold_on_click_rocplot(clickData):
 # data ag grid #
 
 
+def _raw_data_path(dataset_key):
+    return os.path.join(DATA_FOLDER, dataset_key, storage.SAVED_FILE_NAMES["raw data"])
+
+
 @app.callback(
-    Output("ag-grid", "rowData"),
     Output("ag-grid", "columnDefs"),
-    Input("raw-data-for-grid", "data"),
-    Input("file-select", "value"),
+    Input("dataset-key", "data"),
     prevent_inital_call=True,
 )
-def update_data_grid(raw_data_for_grid, selected_file):
-    # Ensure raw_files is a dictionary, even if it starts as None
-    raw_data_for_grid = (
-        raw_data_for_grid if raw_data_for_grid is not None else pd.DataFrame()
-    )
+def update_data_grid(dataset_key):
+    if dataset_key and os.path.isfile(_raw_data_path(dataset_key)):
+        return grid_source.column_defs(_raw_data_path(dataset_key))
+    return []  # Return empty list if no data or file selected
 
-    if raw_data_for_grid and selected_file:
-        row_Data = raw_data_for_grid
-        column_names = list(raw_data_for_grid[0].keys())
-        column_Defs = [{"field": i} for i in column_names]
 
-        return row_Data, column_Defs
-    return [], []  # Return empty lists if no data or file selected
+@app.callback(
+    Output("ag-grid", "getRowsResponse"),
+    Input("ag-grid", "getRowsRequest"),
+    State("dataset-key", "data"),
+    prevent_initial_call=True,
+)
+def serve_data_grid_rows(request, dataset_key):
+    # sorting and filtering happen here, only the requested block is sent
+    if not request or not dataset_key or not os.path.isfile(_raw_data_path(dataset_key)):
+        return {"rowData": [], "rowCount": 0}
+    return grid_source.get_rows(_raw_data_path(dataset_key), request)
+
+
+# the grid keeps its row blocks across column changes, drop them for a new file
+app.clientside_callback(
+    """
+    function (columnDefs) {
+        dash_ag_grid.getApiAsync("ag-grid").then((api) => api.purgeInfiniteCache());
+    }
+    """,
+    Input("ag-grid", "columnDefs"),
+    prevent_initial_call=True,
+)
+
+
+# leaderboard #
+
+
+def load_leaderboard(dataset_key):
+    # stored with the dataset, computed here for folders processed before that
+    file_dir = os.path.join(DATA_FOLDER, dataset_key)
+    board = storage.read_leaderboard(file_dir)
+    if board is None:
+        dataset = dataset_cache.get(DATA_FOLDER, dataset_key)
+        if dataset is None:
+            return None
+        board = leaderboard.compare_columns(
+            pd.read_feather(_raw_data_path(dataset_key)), dataset["roc_curves"]
+        )
+        storage.save_leaderboard(file_dir, board)
+    return board
+
+
+def _p_value_text(p_value):
+    if p_value is None:
+        return ""
+    return "<0.001" if p_value < 0.001 else f"{p_value:.3f}"
+
+
+@app.callback(
+    Output("leaderboard-table", "data"),
+    Output("leaderboard-table", "columns"),
+    Output("leaderboard-pvalues", "data"),
+    Output("leaderboard-pvalues", "columns"),
+    Input("dataset-key", "data"),
+)
+def update_leaderboard(dataset_key):
+    board = load_leaderboard(dataset_key) if dataset_key else None
+    if not board or not board["columns"]:
+        return [], [], [], []
+
+    interval_name = f"{board['level']:.0%} CI (DeLong)"
+    rows = [
+        {
+            "Column": row["column"],
+            "AUC": round(row["auc"], 3),
+            interval_name: f"{row['auc_low']:.3f} – {row['auc_high']:.3f}",
+            "Positives": row["positives"],
+            "Negatives": row["negatives"],
+            "Positive when": "low" if row["mirrored"] else "high",
+        }
+        for row in board["columns"]
+    ]
+    columns = [{"name": name, "id": name} for name in rows[0]]
+
+    names = [row["column"] for row in board["columns"]]
+    if len(names) < 2:
+        return rows, columns, [], []
+    p_value_rows = [
+        {
+            "Column": name,
+            **{
+                other: _p_value_text(board["p_values"][name].get(other))
+                for other in names
+                if other != name
+            },
+        }
+        for name in names
+    ]
+    p_value_columns = [{"name": name, "id": name} for name in ["Column", *names]]
+    return rows, columns, p_value_rows, p_value_columns
 
 
 # buttons #
@@ -619,31 +910,50 @@ def update_unknown_buttons(b1, b2, b3, o1, o2, o3):
     Output("file-select", "options"),
     Output("file-select", "value"),
     Input("processed-files-list", "data"),
+    State("selected-file", "data"),
     prevent_initial_call=False,
 )
-def update_file_dropdown(processed_files_list):  # , current_page):
+def update_file_dropdown(processed_files_list, selected_file):  # , current_page):
     if not processed_files_list:
         return [], None
 
     options = [
         {"label": filename, "value": filename} for filename in processed_files_list
     ]
-    default_value = processed_files_list[-1]
+    if selected_file in processed_files_list:
+        default_value = selected_file
+    else:
+        default_value = processed_files_list[-1]
 
     return options, default_value
 
 
+@app.callback(
+    Output("file-select", "value", allow_duplicate=True),
+    Input("selected-file", "data"),
+    State("file-select", "options"),
+    prevent_initial_call=True,
+)
+def select_finished_file(selected_file, options):
+    # show the dataset a job just finished, e.g. the one rows were appended to;
+    # new uploads are selected by update_file_dropdown as the list grows
+    if selected_file is None or selected_file not in [o["value"] for o in options or []]:
+        return no_update
+    return selected_file
+
+
 @app.callback(
     Output("column-select", "options"),
     Output("column-select", "value"),
-    Input("labeled-data", "data"),
+    Input("dataset-key", "data"),
     prevent_initial_call=True,
 )
-def update_column_dropdown(labeled_data):
-    if not labeled_data:
+def update_column_dropdown(dataset_key):
+    dataset = dataset_cache.get(DATA_FOLDER, dataset_key)
+    if dataset is None:
         return [], None
 
-    column_names = list(labeled_data.keys())
+    column_names = list(dataset["labeled_data"].keys())
     # try:
     #     column_names.remove("reference_result")
     # except ValueError:
@@ -673,6 +983,26 @@ def init_statfit_select(selected_column, pos, neg, unk):
     return pos, neg, unk
 
 
+@callback(
+    Input("column-select", "value"),
+    State("dataset-key", "data"),
+    prevent_initial_call=True,
+)
+def prefetch_column_fits(selected_column, dataset_key):
+    # warm the lazy fits of the selected column so switching distributions is instant
+    dataset = dataset_cache.get(DATA_FOLDER, dataset_key)
+    if not LAZY_FITS or dataset is None or selected_column not in dataset["labeled_data"]:
+        return
+    utils.prefetch_fits(
+        dataset["labeled_data"],
+        dataset["fitted_params"],
+        selected_column,
+        max_workers=FIT_WORKERS,
+        cache_dir=FIT_CACHE_FOLDER,
+        fast=FAST_FITS,
+    )
+
+
 # main graph #
 
 
@@ -692,9 +1022,161 @@ def set_threshold_on_click_maingraph(clickData, range_value):
     return no_update
 
 
+# rug of a sample group: svg points up to RUG_WEBGL_SIZE samples, webgl points up to
+# RUG_DENSITY_SIZE, a binned density strip above that
+RUG_WEBGL_SIZE = 2000
+RUG_DENSITY_SIZE = 50000
+
+# opacity of the density strip for a bin holding one sample, full color at the fullest
+RUG_DENSITY_MIN_ALPHA = 0.3
+
+# groups of the main graph in drawing order, with their trace name and color
+GRAPH_GROUPS = [
+    ("unknown", "Unknown", UNKNOWN),
+    ("negative", "Negative", NEGATIVE),
+    ("positive", "Positive", POSITIVE),
+]
+
+
+def _chart_types(rug_outline, hist_outline, stat_outline):
+    # an outlined button is switched off
+    chart_types = []
+    if not rug_outline:
+        chart_types.append("rug")
+    if not hist_outline:
+        chart_types.append("hist")
+    if not stat_outline:
+        chart_types.append("stat")
+    return chart_types
+
+
+def _rgba(color, alpha):
+    # "#rgb" or "#rrggbb" as an rgba() color
+    hex_digits = color.lstrip("#")
+    if len(hex_digits) == 3:
+        hex_digits = "".join(digit * 2 for digit in hex_digits)
+    red, green, blue = (int(hex_digits[i : i + 2], 16) for i in (0, 2, 4))
+    return f"rgba({red},{green},{blue},{alpha})"
+
+
+def _rug_trace(group_data, name, color, position, range_min, range_max):
+    # the rug of a sample group at height position of the bottom row: every sample as
+    # an svg box point for small groups, as webgl markers with a fixed jitter up to
+    # RUG_DENSITY_SIZE samples, and a density strip of the pyramid counts beyond
+    data = group_data["data"]
+    if len(data) <= RUG_WEBGL_SIZE:
+        return go.Box(
+            x=data,
+            y0=position,
+            marker_symbol="line-ns-open",
+            marker_color=color,
+            boxpoints="all",
+            jitter=0.5,
+            fillcolor="rgba(255,255,255,0)",
+            line_color="rgba(255,255,255,0)",
+            hoveron="points",
+            showlegend=False,
+            name=name,
+            hovertemplate="Threshold: <b>%{x:.2f}</b>",
+        )
+    if len(data) <= RUG_DENSITY_SIZE:
+        jitter = np.random.default_rng(0).uniform(-0.25, 0.25, len(data))
+        return go.Scattergl(
+            x=data,
+            y=(position + jitter).astype(np.float32),
+            mode="markers",
+            marker_symbol="line-ns-open",
+            marker_color=color,
+            showlegend=False,
+            name=name,
+            hovertemplate="Threshold: <b>%{x:.2f}</b>",
+        )
+    bin_centers, counts = utils.base_histogram(group_data, range_min, range_max)
+    # log scale so sparse tails stay visible, empty bins are left blank; the scale
+    # starts at a visible opacity, so a bin with a single sample still shows
+    z = np.where(counts > 0, np.log1p(counts), np.nan).astype(np.float32)
+    return go.Heatmap(
+        x0=bin_centers[0],
+        dx=bin_centers[1] - bin_centers[0],
+        y=[position],
+        z=z[np.newaxis],
+        customdata=counts.astype(np.int32)[np.newaxis],
+        colorscale=[[0, _rgba(color, RUG_DENSITY_MIN_ALPHA)], [1, color]],
+        zmin=0,
+        zmax=float(np.nanmax(z)),
+        showscale=False,
+        name=name,
+        hovertemplate="Threshold: <b>%{x:.2f}</b><br>%{customdata} samples<extra></extra>",
+    )
+
+
+def _range_curves(column_data, range_value, chart_types, fits):
+    # the parts of the main graph that depend on the range slider: histogram bars,
+    # fitted pdfs and the height they need; the bars come from the stored histogram
+    # pyramids, only bins in the range are drawn
+    range_min = column_data.get("range_min", 0)
+    range_max = column_data.get("range_max", 100)
+
+    curves = {"hist": {}, "pdf": {}, "max_height": 0}
+    for group, _, _ in GRAPH_GROUPS:
+        if len(column_data[group]["data"]) == 0:
+            continue
+        if "hist" in chart_types[group]:
+            bar_centers, hist, bar_widths = utils.visible_histogram(
+                column_data[group], range_min, range_max, range_value
+            )
+            curves["hist"][group] = (bar_centers, hist, bar_widths)
+            curves["max_height"] = max(curves["max_height"], max(hist, default=0))
+        if group in fits:
+            fit_dist, params = fits[group]
+            # memoized, a curve is only evaluated again when its fit or the range change
+            x_range_for_pdf, pdf = utils.pdf_curve(fit_dist, params, range_value)
+            curves["pdf"][group] = (x_range_for_pdf, pdf)
+            curves["max_height"] = max(curves["max_height"], max(pdf))
+    return curves
+
+
+def _move_vline(patched, graph_cache, x):
+    shape, annotation = graph_cache["vline"]
+    patched["layout"]["shapes"][shape]["x0"] = x
+    patched["layout"]["shapes"][shape]["x1"] = x
+    patched["layout"]["annotations"][annotation]["x"] = x
+    patched["layout"]["annotations"][annotation]["text"] = f"{x:.2f}"
+
+
+def _patch_graph_range(graph_cache, curves, range_value, slider_value):
+    # the range slider moved on an otherwise unchanged graph, the rug traces holding
+    # every sample stay in the browser and only what depends on the range is sent
+    patched = Patch()
+    # built as a figure so the arrays get plotly's compact binary encoding
+    updates = go.Figure()
+    for kind, group, index in graph_cache["traces"]:
+        if kind == "hist":
+            bar_centers, hist, bar_widths = curves["hist"][group]
+            updates.add_trace(go.Bar(x=bar_centers, y=hist, width=bar_widths))
+        else:
+            x_range_for_pdf, pdf = curves["pdf"][group]
+            updates.add_trace(go.Scatter(x=x_range_for_pdf, y=pdf))
+    for (_, _, index), trace in zip(graph_cache["traces"], updates.to_dict()["data"]):
+        for name in ["x", "y", "width"]:
+            if name in trace:
+                patched["data"][index][name] = trace[name]
+
+    patched["layout"]["xaxis"]["range"] = [range_value[0], range_value[1]]
+    patched["layout"]["xaxis2"]["range"] = [range_value[0], range_value[1]]
+    patched["layout"]["yaxis"]["range"] = [0, curves["max_height"] * 1.1]
+    if graph_cache["pvalue"]:
+        shape, annotation = graph_cache["pvalue"]
+        patched["layout"]["shapes"][shape]["y1"] = curves["max_height"]
+        patched["layout"]["annotations"][annotation]["y"] = curves["max_height"]
+    if graph_cache["vline"] and slider_value is not None:
+        _move_vline(patched, graph_cache, min(max(slider_value, range_value[0]), range_value[1]))
+    return patched
+
+
 @app.callback(
-    # Output("graph-cache", "data"),
     Output("graph", "figure", allow_duplicate=True),
+    Output("graph-cache", "data"),
     [
         Input("pos-statfit-select", "value"),
         Input("neg-statfit-select", "value"),
@@ -708,14 +1190,14 @@ def set_threshold_on_click_maingraph(clickData, range_value):
         Input("unk-btn-1", "outline"),
         Input("unk-btn-2", "outline"),
         Input("unk-btn-3", "outline"),
-        Input("slider-position", "value"),
+        # the threshold is moved by patches, see CLIENTSIDE_THRESHOLD
+        State("slider-position", "value"),
         Input("range-slider", "value"),
         Input("p-value", "value"),
         Input("p-value-input", "value"),
-        State("labeled-data", "data"),
-        State("fit-params", "data"),
-        State("roc-curves", "data"),
+        State("dataset-key", "data"),
         State("column-select", "value"),
+        State("graph-cache", "data"),
     ],
     prevent_initial_call=True,
 )
@@ -736,53 +1218,71 @@ def update_graph_and_cache(
     range_value,
     p_value,
     p_value_input,
-    labeled_data,
-    fitted_params,
-    roc_data,
+    dataset_key,
     selected_column,
+    graph_cache,
 ):
-    if not labeled_data or not selected_column:
+    dataset = dataset_cache.get(DATA_FOLDER, dataset_key)
+    if dataset is None or not selected_column:
         raise dash.exceptions.PreventUpdate
-
-    pos_chart_types = []
-    if not pos_btn1_outline:
-        pos_chart_types.append("rug")
-    if not pos_btn2_outline:
-        pos_chart_types.append("hist")
-    if not pos_btn3_outline:
-        pos_chart_types.append("stat")
-
-    neg_chart_types = []
-    if not neg_btn1_outline:
-        neg_chart_types.append("rug")
-    if not neg_btn2_outline:
-        neg_chart_types.append("hist")
-    if not neg_btn3_outline:
-        neg_chart_types.append("stat")
-
-    unknown_chart_types = []
-    if not unk_btn1_outline:
-        unknown_chart_types.append("rug")
-    if not unk_btn2_outline:
-        unknown_chart_types.append("hist")
-    if not unk_btn3_outline:
-        unknown_chart_types.append("stat")
+    labeled_data = dataset["labeled_data"]
+    fitted_params = dataset["fitted_params"]
 
     column_data = labeled_data.get(selected_column)
-    parameter_data = fitted_params.get(selected_column)
-
-    if pos_fit_dist:
-        pos_params = parameter_data["positive"][pos_fit_dist]
-    if neg_fit_dist:
-        neg_params = parameter_data["negative"][neg_fit_dist]
-    if unknown_fit_dist:
-        unknown_params = parameter_data["unknown"][unknown_fit_dist]
-
-    positive_data = np.array(column_data.get("positive", {}).get("data", []))
-    negative_data = np.array(column_data.get("negative", {}).get("data", []))
-    unknown_data = np.array(column_data.get("unknown", {}).get("data", []))
-    range_min = column_data.get("range_min", 0)
-    range_max = column_data.get("range_max", 100)
+    if not column_data:
+        return None, {}
+
+    chart_types = {
+        "positive": _chart_types(pos_btn1_outline, pos_btn2_outline, pos_btn3_outline),
+        "negative": _chart_types(neg_btn1_outline, neg_btn2_outline, neg_btn3_outline),
+        "unknown": _chart_types(unk_btn1_outline, unk_btn2_outline, unk_btn3_outline),
+    }
+    fit_dists = {
+        "positive": pos_fit_dist,
+        "negative": neg_fit_dist,
+        "unknown": unknown_fit_dist,
+    }
+
+    # only the fits that are actually drawn are requested, see LAZY_FITS
+    fits = {}
+    for group, fit_dist in fit_dists.items():
+        if "stat" not in chart_types[group] or not fit_dist or fit_dist == "none":
+            continue
+        if len(column_data[group]["data"]) == 0:
+            continue
+        params = utils.get_fit(
+            labeled_data,
+            fitted_params,
+            selected_column,
+            group,
+            fit_dist,
+            cache_dir=FIT_CACHE_FOLDER,
+            fast=FAST_FITS,
+        )
+        if utils.has_fit(params):
+            fits[group] = (fit_dist, params)
+
+    curves = _range_curves(column_data, range_value, chart_types, fits)
+
+    # everything but the range: while it stays the same the figure is patched
+    graph_key = [
+        dataset_key,
+        str(dataset["version"]),
+        selected_column,
+        chart_types,
+        fit_dists,
+        p_value,
+        p_value_input,
+    ]
+    if (
+        ctx.triggered_id == "range-slider"
+        and graph_cache
+        and graph_cache.get("key") == graph_key
+    ):
+        return _patch_graph_range(graph_cache, curves, range_value, slider_value), no_update
+
+    # where the patched parts of the figure are
+    graph_cache = {"key": graph_key, "traces": [], "pvalue": None, "vline": None}
 
     fig = make_subplots(
         rows=2,
@@ -793,311 +1293,189 @@ def update_graph_and_cache(
         specs=[[{"type": "xy"}], [{"type": "xy"}]],
     )
 
-    if column_data and parameter_data:
-        # Calculate Histogram points depending of ranger slider
-        bin_edges = utils.calculate_bin_edges(range_value, range_min, range_max)
-        positive_hist, positive_bin_edges = np.histogram(
-            column_data["positive"]["data"],
-            bins=bin_edges,
-            density=True,
+    rug_rows = 0
+    for group, name, color in GRAPH_GROUPS:
+        if len(column_data[group]["data"]) == 0:
+            continue
+        if "rug" in chart_types[group]:
+            fig.add_trace(
+                _rug_trace(
+                    column_data[group],
+                    name,
+                    color,
+                    rug_rows,
+                    column_data.get("range_min", 0),
+                    column_data.get("range_max", 100),
+                ),
+                row=2,
+                col=1,
+            )
+            rug_rows += 1
+        if group in curves["hist"]:
+            bar_centers, hist, bar_widths = curves["hist"][group]
+            graph_cache["traces"].append(["hist", group, len(fig.data)])
+            fig.add_trace(
+                go.Bar(
+                    x=bar_centers,
+                    y=hist,
+                    name=name,
+                    marker_color=color,
+                    width=bar_widths,
+                    opacity=0.7,
+                    hoverinfo="none",
+                ),
+                row=1,
+                col=1,
+            )
+        if group in curves["pdf"]:
+            x_range_for_pdf, pdf = curves["pdf"][group]
+            graph_cache["traces"].append(["pdf", group, len(fig.data)])
+            fig.add_trace(
+                go.Scatter(
+                    x=x_range_for_pdf,
+                    y=pdf,
+                    mode="lines",
+                    name=name,
+                    line_color=color,
+                    hoverinfo="none",
+                ),
+                row=1,
+                col=1,
+            )
+
+    graph_max_height = curves["max_height"]
+    graph_yaxis_range = [0, graph_max_height * 1.1]
+
+    if "positive" in fits and p_value:
+        fit_dist, params = fits["positive"]
+        ppf_at_value = utils.ppf(fit_dist, params, float(p_value_input))
+        fig.add_shape(
+            type="line",
+            x0=ppf_at_value,
+            y0=0,
+            x1=ppf_at_value,
+            y1=graph_max_height,
+            line=dict(color=POSITIVE, width=1, dash="dash"),
         )
-        negative_hist, negative_bin_edges = np.histogram(
-            column_data["negative"]["data"],
-            bins=bin_edges,
-            density=True,
+        fig.add_annotation(
+            x=ppf_at_value,
+            y=graph_max_height,
+            xref="x",
+            yref="y",
+            text="p=" + str(p_value_input),
+            showarrow=False,
+            yanchor="bottom",
+            font=dict(size=10, color=POSITIVE),
+            bgcolor="rgba(0, 0, 0, 0)",
         )
-        unknown_hist, unknown_bin_edges = np.histogram(
-            column_data["unknown"]["data"],
-            bins=bin_edges,
-            density=True,
+        graph_cache["pvalue"] = [len(fig.layout.shapes) - 1, len(fig.layout.annotations) - 1]
+
+    if slider_value is not None and pos_fit_dist != "none" and pos_fit_dist:
+        # the slider may still hold a value from before the range changed
+        slider_value = min(max(slider_value, range_value[0]), range_value[1])
+        fig.add_vline(
+            x=slider_value,
+            # named so the clientside threshold callback can find them
+            name="threshold",
+            annotation_name="threshold",
+            line_width=3,
+            line_dash="dashdot",
+            line_color=THRESHOLD,
+            annotation_text=f"{slider_value:.2f}",
+            annotation_position="top right",
+            annotation_font=dict(size=18),
+            row=1,
+            col=1,
         )
+        graph_cache["vline"] = [len(fig.layout.shapes) - 1, len(fig.layout.annotations) - 1]
+
+    fig.update_yaxes(showticklabels=False, range=[-0.5, max(rug_rows, 1) - 0.5], row=2, col=1)
+    fig.update_xaxes(
+        range=[range_value[0], range_value[1]],
+        showticklabels=True,
+        ticks="inside",
+        nticks=10,
+        row=1,
+        col=1,
+    )
+    fig.update_xaxes(range=[range_value[0], range_value[1]], row=2, col=1)
+    fig.update_layout(
+        margin=dict(l=20, r=20, t=0, b=0),
+        xaxis=dict(
+            title=selected_column,
+            fixedrange=True,
+            side="top",
+        ),
+        yaxis=dict(
+            title="Density",
+            range=graph_yaxis_range,
+        ),
+        showlegend=False,
+        dragmode=False,
+        barmode="group",
+        clickmode="event+select",
+    )
 
-        graph_max_height = 0
-
-        positive_bar_widths = np.diff(positive_bin_edges)
-        negative_bar_widths = np.diff(negative_bin_edges)
-        unknown_bar_widths = np.diff(unknown_bin_edges)
-
-        positive_bar_center = positive_bin_edges[:-1] + positive_bar_widths / 2
-        negative_bar_center = negative_bin_edges[:-1] + negative_bar_widths / 2
-        unknown_bar_center = unknown_bin_edges[:-1] + unknown_bar_widths / 2
-
-        # Unknown Trace
-        if unknown_data.size > 0:
-            if "rug" in unknown_chart_types:
-                fig.add_trace(
-                    go.Box(
-                        x=column_data["unknown"]["data"],
-                        marker_symbol="line-ns-open",
-                        marker_color=UNKNOWN,
-                        boxpoints="all",
-                        jitter=0.5,
-                        fillcolor="rgba(255,255,255,0)",
-                        line_color="rgba(255,255,255,0)",
-                        hoveron="points",
-                        showlegend=False,
-                        name="Unknown",
-                        hovertemplate="Threshold: <b>%{x:.2f}</b>",
-                    ),
-                    row=2,
-                    col=1,
-                )
-            if "hist" in unknown_chart_types:
-                if max(unknown_hist) > graph_max_height:
-                    graph_max_height = max(unknown_hist)
-                fig.add_trace(
-                    go.Bar(
-                        x=unknown_bar_center,
-                        y=unknown_hist,
-                        name="Unknown",
-                        marker_color=UNKNOWN,
-                        width=unknown_bar_widths,
-                        opacity=0.7,
-                        hoverinfo="none",
-                    ),
-                    row=1,
-                    col=1,
-                    secondary_y=False,
-                )
-            if (
-                "stat" in unknown_chart_types
-                and unknown_fit_dist != "none"
-                and unknown_fit_dist
-            ):
-                unknown_params = parameter_data["unknown"][unknown_fit_dist]
-                unknown_dist = getattr(stats, unknown_fit_dist)
-                x_range_for_pdf = np.linspace(range_value[0], range_value[1], 300)
-                unknown_pdf = unknown_dist.pdf(x_range_for_pdf, **unknown_params)
-                if max(unknown_pdf) > graph_max_height:
-                    graph_max_height = max(unknown_pdf)
-                fig.add_trace(
-                    go.Scatter(
-                        x=x_range_for_pdf,
-                        y=unknown_pdf,
-                        mode="lines",
-                        name="Unknown",
-                        line_color=UNKNOWN,
-                        hoverinfo="none",
-                    ),
-                    row=1,
-                    col=1,
-                )
-
-        # Negative Trace
-        if negative_data.size > 0:
-            if "rug" in neg_chart_types:
-                fig.add_trace(
-                    go.Box(
-                        x=column_data["negative"]["data"],
-                        marker_symbol="line-ns-open",
-                        marker_color=NEGATIVE,
-                        boxpoints="all",
-                        jitter=0.5,
-                        fillcolor="rgba(255,255,255,0)",
-                        line_color="rgba(255,255,255,0)",
-                        hoveron="points",
-                        showlegend=False,
-                        name="Negative",
-                        hovertemplate="Threshold: <b>%{x:.2f}</b>",
-                    ),
-                    row=2,
-                    col=1,
-                )
-
-            if "hist" in neg_chart_types:
-                if max(negative_hist) > graph_max_height:
-                    graph_max_height = max(negative_hist)
-                fig.add_trace(
-                    go.Bar(
-                        x=negative_bar_center,
-                        y=negative_hist,
-                        name="Negative",
-                        marker_color=NEGATIVE,
-                        width=negative_bar_widths,
-                        opacity=0.7,
-                        hoverinfo="none",
-                    ),
-                    row=1,
-                    col=1,
-                )
-
-            if "stat" in neg_chart_types and neg_fit_dist != "none" and neg_fit_dist:
-                neg_params = parameter_data["negative"][neg_fit_dist]
-                negative_dist = getattr(stats, neg_fit_dist)
-                x_range_for_pdf = np.linspace(range_value[0], range_value[1], 300)
-                negative_pdf = negative_dist.pdf(x_range_for_pdf, **neg_params)
-                if max(negative_pdf) > graph_max_height:
-                    graph_max_height = max(negative_pdf)
-                fig.add_trace(
-                    go.Scatter(
-                        x=x_range_for_pdf,
-                        y=negative_pdf,
-                        mode="lines",
-                        name="Negative",
-                        line_color=NEGATIVE,
-                        hoverinfo="none",
-                    ),
-                    row=1,
-                    col=1,
-                )
-
-        # Positive Trace
-        if positive_data.size > 0:
-            if "rug" in pos_chart_types:
-                fig.add_trace(
-                    go.Box(
-                        x=column_data["positive"]["data"],
-                        marker_symbol="line-ns-open",
-                        marker_color=POSITIVE,
-                        boxpoints="all",
-                        jitter=0.5,
-                        fillcolor="rgba(255,255,255,0)",
-                        line_color="rgba(255,255,255,0)",
-                        hoveron="points",
-                        showlegend=False,
-                        name="Positive",
-                        hovertemplate="Threshold: <b>%{x:.2f}</b>",
-                    ),
-                    row=2,
-                    col=1,
-                )
-
-            if "hist" in pos_chart_types:
-                if max(positive_hist) > graph_max_height:
-                    graph_max_height = max(positive_hist)
-                fig.add_trace(
-                    go.Bar(
-                        x=positive_bar_center,
-                        y=positive_hist,
-                        name="Positive",
-                        marker_color=POSITIVE,
-                        width=positive_bar_widths,
-                        opacity=0.7,
-                        hoverinfo="none",
-                    ),
-                    row=1,
-                    col=1,
-                )
-
-            if "stat" in pos_chart_types and pos_fit_dist != "none" and pos_fit_dist:
-                pos_params = parameter_data["positive"][pos_fit_dist]
-                positive_dist = getattr(stats, pos_fit_dist)
-                x_range_for_pdf = np.linspace(range_value[0], range_value[1], 300)
-                positive_pdf = positive_dist.pdf(x_range_for_pdf, **pos_params)
-                if max(positive_pdf) > graph_max_height:
-                    graph_max_height = max(positive_pdf)
-                fig.add_trace(
-                    go.Scatter(
-                        x=x_range_for_pdf,
-                        y=positive_pdf,
-                        mode="lines",
-                        name="Positive",
-                        line_color=POSITIVE,
-                        hoverinfo="none",
-                    ),
-                    row=1,
-                    col=1,
-                ),
+    return fig, graph_cache
 
-        graph_yaxis_range = [0, graph_max_height * 1.1]
 
+if not CLIENTSIDE_THRESHOLD:
+    # the server side version of assets/threshold.js, the figures are patched
+    @app.callback(
+        Output("roc_plot", "figure", allow_duplicate=True),
+        Output("roc-table", "data", allow_duplicate=True),
+        Output("graph", "figure", allow_duplicate=True),
+        Input("slider-position", "value"),
+        State("range-slider", "value"),
+        State("graph-cache", "data"),
+        State("dataset-key", "data"),
+        State("column-select", "value"),
+        prevent_initial_call=True,
+    )
+    def move_threshold(slider_value, range_value, graph_cache, dataset_key, selected_column):
+        dataset = dataset_cache.get(DATA_FOLDER, dataset_key)
+        if dataset is None or not selected_column or slider_value is None:
+            raise dash.exceptions.PreventUpdate
+
+        graph_patch = no_update
+        if graph_cache and graph_cache.get("vline"):
+            vline_x = slider_value
+            if range_value:
+                vline_x = min(max(vline_x, range_value[0]), range_value[1])
+            graph_patch = Patch()
+            _move_vline(graph_patch, graph_cache, vline_x)
+
+        roc_column = dataset["roc_curves"].get(selected_column)
         if (
-            "stat" in pos_chart_types
-            and pos_fit_dist != "none"
-            and pos_fit_dist
-            and positive_data.size > 0
+            not roc_column
+            or len(roc_column.get("values", [])) == 0
+            or roc_column["total_positive"] + roc_column["total_negative"] == 0
         ):
-            if p_value:
-                ppf_at_value = positive_dist.ppf(float(p_value_input), **pos_params)
-                fig.add_shape(
-                    type="line",
-                    x0=ppf_at_value,
-                    y0=0,
-                    x1=ppf_at_value,
-                    y1=graph_max_height,
-                    line=dict(color=POSITIVE, width=1, dash="dash"),
-                )
-                fig.add_annotation(
-                    x=ppf_at_value,
-                    y=graph_max_height,
-                    xref="x",
-                    yref="y",
-                    text="p=" + str(p_value_input),
-                    showarrow=False,
-                    yanchor="bottom",
-                    font=dict(size=10, color=POSITIVE),
-                    bgcolor="rgba(0, 0, 0, 0)",
-                )
-
-        # Comment for cache func
-        if slider_value is not None and pos_fit_dist != "none" and pos_fit_dist:
-            fig.add_vline(
-                x=slider_value,
-                line_width=3,
-                line_dash="dashdot",
-                line_color=THRESHOLD,
-                annotation_text=f"{slider_value:.2f}",
-                annotation_position="top right",
-                annotation_font=dict(size=18),
-                row=1,
-                col=1,
-            ),
-
-        fig.update_yaxes(showticklabels=False, row=2, col=1)
-        fig.update_xaxes(
-            range=[range_value[0], range_value[1]],
-            showticklabels=True,
-            ticks="inside",
-            nticks=10,
-            row=1,
-            col=1,
+            return no_update, no_update, graph_patch
+
+        norm_params = utils.get_fit(
+            dataset["labeled_data"],
+            dataset["fitted_params"],
+            selected_column,
+            "positive",
+            "norm",
+            cache_dir=FIT_CACHE_FOLDER,
+            fast=FAST_FITS,
         )
-        fig.update_xaxes(range=[range_value[0], range_value[1]], row=2, col=1)
-        fig.update_layout(
-            margin=dict(l=20, r=20, t=0, b=0),
-            xaxis=dict(
-                title=selected_column,
-                fixedrange=True,
-                side="top",
-            ),
-            yaxis=dict(
-                title="Density",
-                range=graph_yaxis_range,
-            ),
-            showlegend=False,
-            dragmode=False,
-            barmode="group",
-            clickmode="event+select",
+        ROCDataTable_data, _, roc_index = utils.gen_roc_table(
+            roc_column, slider_value, norm_params
         )
-
-        return fig  # .to_dict()
-
-
-# @callback(
-#     Output("graph", "figure", allow_duplicate=True),
-#     Input("slider-position", "value"),
-#     State("graph-cache", "data"),
-#     prevent_initial_call=True,
-# )
-# def load_graph_add_vline(slider_position, graph_json):
-#     if not graph_json:
-#         raise dash.exceptions.PreventUpdate
-#
-#     graph = go.Figure(graph_json)
-#
-#     if slider_position is not None:
-#         graph.add_vline(
-#             x=slider_position,
-#             line_width=3,
-#             line_dash="dashdot",
-#             line_color=THRESHOLD,
-#             annotation_text=f"{slider_position:.2f}",
-#             annotation_position="top right",
-#             annotation_font=dict(size=18),
-#             row=1,
-#             col=1,
-#         ),
-#     return graph
+        ROCDataTable_data = add_interval_rows(
+            ROCDataTable_data,
+            roc_intervals(dataset, dataset_key, selected_column),
+            slider_value,
+        )
+        marker_x, marker_y, threshold = utils.threshold_point(roc_column, roc_index)
+        roc_patch = Patch()
+        roc_patch["data"][ROC_MARKER_TRACE]["x"] = [marker_x]
+        roc_patch["data"][ROC_MARKER_TRACE]["y"] = [marker_y]
+        roc_patch["data"][ROC_MARKER_TRACE]["customdata"] = [threshold]
+        return roc_patch, ROCDataTable_data, graph_patch
 
 
 # Init preprocessed data #
@@ -1105,7 +1483,6 @@ def update_graph_and_cache(
 
 def check_for_processed_files(data):
     processed_files = []
-    required_files = list(SAVED_FILE_NAMES.values())
 
     if not os.path.isdir(data):
         return False
@@ -1116,8 +1493,15 @@ def check_for_processed_files(data):
         if os.path.isdir(os.path.join(data, f))
     ]
     for folder in folders:
-        if set(os.listdir(folder)) == set(required_files + [os.path.split(folder)[1]]):
-            processed_files.append(os.path.split(folder)[1])
+        filename = os.path.split(folder)[1]
+        if (
+            os.path.isfile(os.path.join(folder, filename))
+            and os.path.isfile(
+                os.path.join(folder, storage.SAVED_FILE_NAMES["raw data"])
+            )
+            and storage.is_processed(folder)
+        ):
+            processed_files.append(filename)
     return processed_files
 
 
@@ -6,6 +6,10 @@ dagcomponentfuncs.Button = function (props) {
     function onClick() {
         setData();
     }
+    // rows without the action, e.g. uploads that are still being processed
+    if (!props.value) {
+        return null;
+    }
     return React.createElement(
         'button',
         {
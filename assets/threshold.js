@@ -0,0 +1,165 @@
+// Clientside threshold updates, see CLIENTSIDE_THRESHOLD in app.py.
+// The server sends utils.threshold_arrays once per column; moving the threshold then
+// recomputes the roc table and moves the roc marker and the main graph vline here.
+
+window.dash_clientside = window.dash_clientside || {};
+
+(function () {
+    // python's round(x, 2): correctly rounded, exact ties go to the even digit
+    function round2(x) {
+        if (!Number.isFinite(x)) {
+            return null;
+        }
+        const fixed = Math.abs(x).toFixed(20);
+        const point = fixed.indexOf(".");
+        if (fixed.slice(point + 3) === "5" + "0".repeat(17)) {
+            const truncated = Number(fixed.slice(0, point + 3));
+            const even = Number(fixed[point + 2]) % 2 === 0;
+            return Math.sign(x) * Number((even ? truncated : truncated + 0.01).toFixed(2));
+        }
+        return Number(x.toFixed(2));
+    }
+
+    // number of values < threshold, like np.searchsorted(values, threshold, "left")
+    function bisectLeft(values, threshold) {
+        let lo = 0;
+        let hi = values.length;
+        while (lo < hi) {
+            const mid = (lo + hi) >> 1;
+            if (values[mid] < threshold) {
+                lo = mid + 1;
+            } else {
+                hi = mid;
+            }
+        }
+        return lo;
+    }
+
+    // same numbers as utils.gen_roc_table
+    function rocTable(arrays, threshold) {
+        const k = bisectLeft(arrays.values, threshold);
+        let fn = arrays.positive_below[k];
+        let tn = arrays.negative_below[k];
+        let un = arrays.unknown_below[k];
+        let tp = arrays.total_positive - fn;
+        let fp = arrays.total_negative - tn;
+        let up = arrays.total_unknown - un;
+        if (arrays.mirrored) {
+            [tp, fn] = [fn, tp];
+            [fp, tn] = [tn, fp];
+            [up, un] = [un, up];
+        }
+        const totalPositive = arrays.total_positive;
+        const totalNegative = arrays.total_negative;
+        const totalClassified = totalPositive + totalNegative;
+        const norm = arrays.norm;
+        const zScore = norm && norm.scale !== 0 ? (threshold - norm.loc) / norm.scale : NaN;
+        return {
+            "TP": tp,
+            "TN": tn,
+            "FN": fn,
+            "FP": fp,
+            "Sensitivity (TPR)": totalPositive > 0 ? round2(tp / totalPositive) : 0,
+            "Specificity (TNR)": totalNegative > 0 ? round2(tn / totalNegative) : 0,
+            "Positive Predictions": up,
+            "Negative Predictions": un,
+            "Accuracy": totalClassified > 0 ? round2((tp + tn) / totalClassified) : 0,
+            "PPV": round2(tp / (tp + fp)),
+            "Z-score": round2(zScore),
+        };
+    }
+
+    function intervalText(low, high) {
+        return round2(low).toFixed(2) + " – " + round2(high).toFixed(2);
+    }
+
+    // the table rows as app.add_interval_rows builds them
+    function rocTableRows(arrays, threshold) {
+        const row = rocTable(arrays, threshold);
+        const intervals = arrays.intervals;
+        if (!intervals) {
+            return [row];
+        }
+        const estimate = Object.assign({}, row, {row: "Estimate", AUC: round2(intervals.auc)});
+        const interval = {
+            row: Math.round(intervals.level * 100) + "% CI",
+            AUC: intervalText(intervals.auc_low, intervals.auc_high),
+        };
+        if (intervals.sensitivity) {
+            const point = bisectLeft(intervals.thresholds, threshold);
+            interval["Sensitivity (TPR)"] = intervalText(
+                intervals.sensitivity_low[point], intervals.sensitivity_high[point]
+            );
+            interval["Specificity (TNR)"] = intervalText(
+                intervals.specificity_low[point], intervals.specificity_high[point]
+            );
+        }
+        return [estimate, interval];
+    }
+
+    // roc marker position as in utils.plot_roc_curve
+    function rocMarker(arrays, threshold) {
+        const k = bisectLeft(arrays.values, threshold);
+        const positivesBelow = arrays.positive_below[k];
+        const negativesBelow = arrays.negative_below[k];
+        let tpr = arrays.total_positive > 0
+            ? (arrays.total_positive - positivesBelow) / arrays.total_positive
+            : 0;
+        let tnr = arrays.total_negative > 0 ? negativesBelow / arrays.total_negative : 0;
+        if (arrays.mirrored) {
+            tpr = 1 - tpr;
+            tnr = 1 - tnr;
+        }
+        const value = arrays.values[Math.min(k, arrays.values.length - 1)];
+        return {x: tnr, y: tpr, threshold: value};
+    }
+
+    window.dash_clientside.threshold = {
+        update_roc: function (threshold, arrays, rocFigure) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (threshold === null || threshold === undefined || !arrays || !rocFigure) {
+                return [noUpdate, noUpdate];
+            }
+            const marker = rocMarker(arrays, threshold);
+            const figure = Object.assign({}, rocFigure);
+            figure.data = rocFigure.data.map(function (trace) {
+                if (trace.name !== "Threshold Point") {
+                    return trace;
+                }
+                return Object.assign({}, trace, {
+                    x: [marker.x],
+                    y: [marker.y],
+                    customdata: [marker.threshold],
+                });
+            });
+            return [figure, rocTableRows(arrays, threshold)];
+        },
+
+        move_vline: function (threshold, range, figure) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (threshold === null || threshold === undefined || !figure || !figure.layout) {
+                return noUpdate;
+            }
+            const layout = figure.layout;
+            if (!(layout.shapes || []).some((shape) => shape.name === "threshold")) {
+                return noUpdate;
+            }
+            // the vline never leaves the range the server drew the graph for
+            let x = threshold;
+            if (range) {
+                x = Math.min(Math.max(x, range[0]), range[1]);
+            }
+            const newLayout = Object.assign({}, layout, {
+                shapes: layout.shapes.map((shape) =>
+                    shape.name === "threshold" ? Object.assign({}, shape, {x0: x, x1: x}) : shape
+                ),
+                annotations: (layout.annotations || []).map((annotation) =>
+                    annotation.name === "threshold"
+                        ? Object.assign({}, annotation, {x: x, text: x.toFixed(2)})
+                        : annotation
+                ),
+            });
+            return Object.assign({}, figure, {layout: newLayout});
+        },
+    };
+})();
@@ -0,0 +1,110 @@
+"""Compare utils.make_roc_curve against the previous pure-Python implementation.
+
+Run from the repository root:
+
+    python benchmarks/bench_make_roc_curve.py
+    python benchmarks/bench_make_roc_curve.py --sizes 1000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import utils  # noqa: E402
+
+
+def legacy_make_roc_curve(labeled_data):
+    # tuple-list implementation that make_roc_curve replaced, kept for reference
+    roc_curves = {}
+    for column, data in labeled_data.items():
+        positive_tuples = [(value, True) for value in data["positive"]["data"]]
+        negative_tuples = [(value, False) for value in data["negative"]["data"]]
+        unknown_tuples = [(value, None) for value in data["unknown"]["data"]]
+        population_data = sorted(
+            positive_tuples + negative_tuples + unknown_tuples, key=lambda x: x[0]
+        )
+
+        current_positive_count = 0
+        current_negative_count = 0
+        current_unknown_count = 0
+        accumulated_positive_at_value = []
+        accumulated_negative_at_value = []
+        accumulated_unknown_at_value = []
+        for value, label in population_data:
+            if label is True:
+                current_positive_count += 1
+            elif label is False:
+                current_negative_count += 1
+            elif label is None:
+                current_unknown_count += 1
+            accumulated_positive_at_value.append(current_positive_count)
+            accumulated_negative_at_value.append(current_negative_count)
+            accumulated_unknown_at_value.append(current_unknown_count)
+
+        roc_curves[column] = {
+            "population_data": population_data,
+            "accumulated_positive_at_value": accumulated_positive_at_value,
+            "accumulated_negative_at_value": accumulated_negative_at_value,
+            "accumulated_unknown_at_value": accumulated_unknown_at_value,
+        }
+    return roc_curves
+
+
+def make_labeled_data(size, rng):
+    # roughly the shape of our assay exports: few labeled samples, many unknowns
+    n_positive = size // 20
+    n_negative = size // 20
+    n_unknown = size - n_positive - n_negative
+    return {
+        "value": {
+            "positive": {"data": np.sort(rng.normal(25, 8, n_positive).round(2))},
+            "negative": {"data": np.sort(rng.normal(3, 2, n_negative).round(2))},
+            "unknown": {"data": np.sort(rng.gamma(2, 2, n_unknown).round(2))},
+        }
+    }
+
+
+def best_of(func, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--skip-legacy-above",
+        type=int,
+        default=2_000_000,
+        help="don't time the legacy implementation above this many rows",
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>10} {'legacy (s)':>12} {'numpy (s)':>12} {'speedup':>9}")
+    for size in args.sizes:
+        labeled_data = make_labeled_data(size, rng)
+        new_time = best_of(utils.make_roc_curve, labeled_data, args.repeat)
+        if size <= args.skip_legacy_above:
+            old_time = best_of(legacy_make_roc_curve, labeled_data, args.repeat)
+            print(
+                f"{size:>10} {old_time:>12.4f} {new_time:>12.4f} {old_time / new_time:>8.1f}x"
+            )
+        else:
+            print(f"{size:>10} {'-':>12} {new_time:>12.4f} {'-':>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Compare the pyarrow and pandas engines of readers.read_tsv on synthetic TSVs.
+
+Run from the repository root:
+
+    python benchmarks/bench_read.py
+    python benchmarks/bench_read.py --rows 100000 5000000 --columns 12
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import readers  # noqa: E402
+
+
+def write_tsv(path, rows, columns, rng):
+    # an ID, reference_result with mostly unknowns, and numeric assay columns
+    df = pd.DataFrame({"ID": [f"S{i:08d}" for i in range(rows)]})
+    df["reference_result"] = rng.choice(
+        [1.0, 0.0, -1.0, np.nan], size=rows, p=[0.05, 0.05, 0.01, 0.89]
+    )
+    for column in range(columns):
+        df[f"assay_{column}"] = rng.gamma(2, 2, rows).round(3)
+    df.to_csv(path, sep="\t", index=False)
+
+
+def best_of(path, engine, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        readers.read_tsv(path, engine=engine)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"cpus: {os.cpu_count()}")
+    print(f"{'rows':>10} {'MB':>8} {'pandas (s)':>12} {'pyarrow (s)':>12} {'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = os.path.join(tmp, f"bench_{rows}.tsv")
+            write_tsv(path, rows, args.columns, rng)
+            size_mb = os.path.getsize(path) / 1e6
+            pandas_time = best_of(path, "pandas", args.repeat)
+            arrow_time = best_of(path, "pyarrow", args.repeat)
+            print(
+                f"{rows:>10} {size_mb:>8.1f} {pandas_time:>12.3f} {arrow_time:>12.3f}"
+                f" {pandas_time / arrow_time:>8.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
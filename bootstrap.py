@@ -0,0 +1,176 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Bootstrap confidence intervals for the roc table and the AUC.
+# Positives and negatives are resampled separately, so every replicate keeps the
+# class sizes. A batch of replicates is one matrix of resample indices per class,
+# turned into per-sample weights; the statistics of the whole batch then come from
+# cumulative sums of those weights over the sorted samples, without a python loop
+# per replicate. Batches are seeded from one SeedSequence, so the intervals only
+# depend on the seed, not on how the batches are spread over worker processes.
+
+REPLICATES = 2000
+SEED = 0
+LEVEL = 0.95
+
+# resample indices per batch, bounds the memory of one batch
+BATCH_ELEMENTS = 1 << 22
+
+# replicate counts from which batches go to a process pool
+PARALLEL_REPLICATES = 20000
+
+# replicates x roc points kept for the per-threshold intervals, above that only the
+# AUC interval is computed
+MAX_THRESHOLD_ELEMENTS = 1 << 26
+
+
+def roc_points(positive, negative):
+    # thresholds of the roc points as utils.plot_roc_curve draws them, the distinct
+    # labeled values, and per point the positives and negatives below the threshold;
+    # the last point calls every sample negative
+    thresholds = np.unique(np.concatenate([positive, negative]))
+    positives_below = np.append(
+        np.searchsorted(positive, thresholds, side="left"), positive.size
+    )
+    negatives_below = np.append(
+        np.searchsorted(negative, thresholds, side="left"), negative.size
+    )
+    return thresholds, positives_below, negatives_below
+
+
+def _resample_weights(rng, size, replicates):
+    # (replicates, size) counts of how often each sample was drawn
+    indices = rng.integers(0, size, (replicates, size))
+    indices += np.arange(replicates)[:, np.newaxis] * size
+    return np.bincount(indices.ravel(), minlength=replicates * size).reshape(
+        replicates, size
+    )
+
+
+def _statistics(positive_weights, negative_weights, points, auc_bounds):
+    # sensitivity and specificity at every roc point and the AUC of each replicate,
+    # unmirrored; weights are (replicates, class size)
+    positives_below, negatives_below = points
+    below_start, above_start = auc_bounds
+    n_positive = positive_weights.shape[1]
+    n_negative = negative_weights.shape[1]
+
+    positive_cumulative = np.zeros((positive_weights.shape[0], n_positive + 1))
+    np.cumsum(positive_weights, axis=1, out=positive_cumulative[:, 1:])
+    negative_cumulative = np.zeros((negative_weights.shape[0], n_negative + 1))
+    np.cumsum(negative_weights, axis=1, out=negative_cumulative[:, 1:])
+
+    sensitivity = specificity = None
+    if positives_below is not None:
+        sensitivity = 1 - positive_cumulative[:, positives_below] / n_positive
+        specificity = negative_cumulative[:, negatives_below] / n_negative
+
+    # AUC = P(negative < positive) + P(tie) / 2, each positive weighted by how often
+    # it was drawn against the negatives drawn below and equal to it
+    below = negative_cumulative[:, below_start]
+    ties = negative_cumulative[:, above_start] - below
+    auc = (positive_weights * (below + ties / 2)).sum(axis=1) / (n_positive * n_negative)
+    return sensitivity, specificity, auc
+
+
+def _run_batch(positive, negative, points, seed_sequence, replicates):
+    rng = np.random.default_rng(seed_sequence)
+    auc_bounds = (
+        np.searchsorted(negative, positive, side="left"),
+        np.searchsorted(negative, positive, side="right"),
+    )
+    sensitivity, specificity, auc = _statistics(
+        _resample_weights(rng, positive.size, replicates),
+        _resample_weights(rng, negative.size, replicates),
+        points,
+        auc_bounds,
+    )
+    if sensitivity is not None:
+        sensitivity = sensitivity.astype(np.float32)
+        specificity = specificity.astype(np.float32)
+    return sensitivity, specificity, auc
+
+
+def roc_intervals(
+    positive,
+    negative,
+    mirrored,
+    replicates=REPLICATES,
+    seed=SEED,
+    level=LEVEL,
+    max_workers=None,
+):
+    # point estimates and percentile intervals of the AUC and, at every roc point of
+    # roc_points, of the sensitivity and specificity; None without both classes.
+    # mirrored as in utils.make_roc_curve, low values are then called positive
+    positive = np.sort(np.asarray(positive, dtype=float))
+    negative = np.sort(np.asarray(negative, dtype=float))
+    if positive.size == 0 or negative.size == 0:
+        return None
+
+    thresholds, positives_below, negatives_below = roc_points(positive, negative)
+    per_threshold = replicates * positives_below.size <= MAX_THRESHOLD_ELEMENTS
+    points = (positives_below, negatives_below) if per_threshold else (None, None)
+
+    batch_size = max(1, BATCH_ELEMENTS // (positive.size + negative.size))
+    batch_sizes = [batch_size] * (replicates // batch_size)
+    if replicates % batch_size:
+        batch_sizes.append(replicates % batch_size)
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+
+    if max_workers == 1 or replicates < PARALLEL_REPLICATES or len(batch_sizes) <= 1:
+        batches = [
+            _run_batch(positive, negative, points, seed_sequence, size)
+            for seed_sequence, size in zip(seed_sequences, batch_sizes)
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            batches = list(
+                executor.map(
+                    _run_batch,
+                    [positive] * len(batch_sizes),
+                    [negative] * len(batch_sizes),
+                    [points] * len(batch_sizes),
+                    seed_sequences,
+                    batch_sizes,
+                )
+            )
+
+    estimate = _statistics(
+        np.ones((1, positive.size)),
+        np.ones((1, negative.size)),
+        points,
+        (
+            np.searchsorted(negative, positive, side="left"),
+            np.searchsorted(negative, positive, side="right"),
+        ),
+    )
+    quantiles = [(1 - level) / 2, 1 - (1 - level) / 2]
+
+    def interval(index):
+        # estimate, low, high of statistic index, mirrored if needed
+        samples = np.concatenate([batch[index] for batch in batches])
+        point = estimate[index][0]
+        low, high = np.quantile(samples, quantiles, axis=0)
+        if mirrored:
+            return 1 - point, 1 - high, 1 - low
+        return point, low, high
+
+    auc, auc_low, auc_high = interval(2)
+    intervals = {
+        "replicates": replicates,
+        "seed": seed,
+        "level": level,
+        "auc": float(auc),
+        "auc_low": float(auc_low),
+        "auc_high": float(auc_high),
+        "thresholds": thresholds,
+    }
+    if per_threshold:
+        for index, name in [(0, "sensitivity"), (1, "specificity")]:
+            point, low, high = interval(index)
+            intervals[name] = point
+            intervals[name + "_low"] = low.astype(float)
+            intervals[name + "_high"] = high.astype(float)
+    return intervals
@@ -0,0 +1,67 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import storage
+
+# Per-process LRU of loaded datasets, so callbacks get the arrays of the selected
+# file by its key instead of having them round-trip through dcc.Store as JSON.
+# Arrays are memory-mapped by storage.load_dataset; their size still counts
+# toward the budget since the pages end up in memory once they are read.
+
+MAX_CACHE_BYTES = 1024 * 1024 * 1024
+
+_datasets = OrderedDict()  # dataset folder -> (dataset, nbytes)
+_lock = threading.Lock()
+
+
+def _nbytes(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sum(_nbytes(value) for value in obj.values())
+    return 0
+
+
+def get(data_folder, key):
+    # {"labeled_data", "roc_curves", "fitted_params", "version"} of a processed file,
+    # or None when there is no such dataset; version changes whenever the dataset is
+    # saved again, e.g. after rows were appended
+    if not key:
+        return None
+    file_dir = os.path.join(data_folder, key)
+
+    with _lock:
+        if file_dir in _datasets:
+            _datasets.move_to_end(file_dir)
+            return _datasets[file_dir][0]
+
+    if not storage.is_processed(file_dir):
+        return None
+    labeled_data, roc_curves, fitted_params = storage.load_dataset(file_dir)
+    dataset = {
+        "labeled_data": labeled_data,
+        "roc_curves": roc_curves,
+        "fitted_params": fitted_params,
+        "version": os.stat(
+            os.path.join(file_dir, storage.SAVED_FILE_NAMES["header"])
+        ).st_mtime_ns,
+    }
+
+    with _lock:
+        _datasets[file_dir] = (dataset, _nbytes(dataset))
+        _datasets.move_to_end(file_dir)
+        total_bytes = sum(nbytes for _, nbytes in _datasets.values())
+        # evict least recently used, but always keep the dataset just loaded
+        while total_bytes > MAX_CACHE_BYTES and len(_datasets) > 1:
+            _, (_, nbytes) = _datasets.popitem(last=False)
+            total_bytes -= nbytes
+    return dataset
+
+
+def invalidate(data_folder, key):
+    # forget a dataset whose files were replaced or deleted
+    with _lock:
+        _datasets.pop(os.path.join(data_folder, key), None)
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import scipy
+
+# Persistent cache of fitted distribution parameters.
+# Entries are addressed by the content of the sample group, so identical groups
+# (same file re-uploaded, columns shared between files) are only ever fitted once.
+# Each entry is a small json file; the file mtime is the LRU clock.
+
+MAX_CACHE_BYTES = 16 * 1024 * 1024
+
+
+def data_digest(data):
+    # sha256 of the sorted float64 samples, shared by every distribution fitted to them
+    data = np.sort(np.asarray(data, dtype=np.float64))
+    return hashlib.sha256(data.tobytes()).hexdigest()
+
+
+def fit_key(dist_name, digest, fast=False):
+    # the same samples fitted by another scipy version, or in fast mode, are a different entry
+    key = f"{digest}:{dist_name}:{scipy.__version__}"
+    if fast:
+        key += ":fast"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key + ".json")
+
+
+def get(cache_dir, key):
+    path = _entry_path(cache_dir, key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            params = json.load(f)
+        os.utime(path)  # mark as recently used
+    except (OSError, ValueError):
+        return None
+    return params
+
+
+def put(cache_dir, key, params):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _entry_path(cache_dir, key)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({name: float(value) for name, value in params.items()}, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        # the cache is best effort, a failed write only costs a refit later
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def evict(cache_dir, max_bytes=MAX_CACHE_BYTES):
+    # drop least recently used entries until the cache fits in max_bytes
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".json"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_bytes -= size
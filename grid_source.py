@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+# Row source for AG Grids in infinite row model: the grid asks for a block of rows
+# (startRow, endRow) with its sort and filter model, and only that block is read
+# from the feather file and serialized.
+
+TABLE_CACHE_SIZE = 4  # open feather files
+VIEW_CACHE_SIZE = 16  # sorted/filtered row orders, reused while scrolling
+
+_tables = OrderedDict()  # (path, mtime) -> pyarrow.Table
+_views = OrderedDict()  # (path, mtime, sort, filter) -> row indices or None for all
+_lock = threading.Lock()
+
+NUMBER_FILTER_OPS = {
+    "equals": pc.equal,
+    "notEqual": pc.not_equal,
+    "lessThan": pc.less,
+    "lessThanOrEqual": pc.less_equal,
+    "greaterThan": pc.greater,
+    "greaterThanOrEqual": pc.greater_equal,
+}
+
+
+def _remember(cache, key, value, max_size):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_size:
+        cache.popitem(last=False)
+
+
+def open_table(path):
+    # memory-mapped when the file is uncompressed, the table is shared by all requests
+    key = (path, os.stat(path).st_mtime_ns)
+    with _lock:
+        if key in _tables:
+            _tables.move_to_end(key)
+            return _tables[key]
+    table = feather.read_table(path, memory_map=True)
+    with _lock:
+        _remember(_tables, key, table, TABLE_CACHE_SIZE)
+    return table
+
+
+def column_defs(path):
+    # column definitions from the schema only, numeric columns get number filters
+    defs = []
+    for field in open_table(path).schema:
+        column_def = {"field": field.name}
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            column_def["filter"] = "agNumberColumnFilter"
+        defs.append(column_def)
+    return defs
+
+
+def _condition_mask(column, condition):
+    filter_type = condition.get("type")
+    if filter_type == "blank":
+        return pc.is_null(column, nan_is_null=True)
+    if filter_type == "notBlank":
+        return pc.invert(pc.is_null(column, nan_is_null=True))
+
+    if condition.get("filterType") == "number":
+        if filter_type == "inRange":
+            return pc.and_(
+                pc.greater_equal(column, condition["filter"]),
+                pc.less_equal(column, condition["filterTo"]),
+            )
+        return NUMBER_FILTER_OPS[filter_type](column, condition["filter"])
+
+    # text filters are case insensitive, as in the client side row model
+    text = pc.cast(column, pa.string())
+    pattern = str(condition.get("filter", ""))
+    if filter_type == "contains":
+        return pc.match_substring(text, pattern, ignore_case=True)
+    if filter_type == "notContains":
+        return pc.invert(pc.match_substring(text, pattern, ignore_case=True))
+    if filter_type == "startsWith":
+        return pc.starts_with(text, pattern, ignore_case=True)
+    if filter_type == "endsWith":
+        return pc.ends_with(text, pattern, ignore_case=True)
+    equal = pc.equal(pc.utf8_lower(text), pattern.lower())
+    if filter_type == "notEqual":
+        return pc.invert(equal)
+    return equal
+
+
+def _filter_mask(column, model):
+    # a column filter is one condition, or several joined by operator
+    conditions = model.get("conditions")
+    if conditions is None and "condition1" in model:
+        conditions = [model["condition1"], model["condition2"]]
+    if conditions is None:
+        return _condition_mask(column, model)
+
+    join = pc.or_kleene if model.get("operator") == "OR" else pc.and_kleene
+    mask = _condition_mask(column, {"filterType": model.get("filterType"), **conditions[0]})
+    for condition in conditions[1:]:
+        mask = join(
+            mask, _condition_mask(column, {"filterType": model.get("filterType"), **condition})
+        )
+    return mask
+
+
+def _view_indices(path, table, sort_model, filter_model):
+    # row order of the table after filtering and sorting, None when it is untouched
+    if not sort_model and not filter_model:
+        return None
+    key = (
+        path,
+        os.stat(path).st_mtime_ns,
+        json.dumps(sort_model, sort_keys=True),
+        json.dumps(filter_model, sort_keys=True),
+    )
+    with _lock:
+        if key in _views:
+            _views.move_to_end(key)
+            return _views[key]
+
+    indices = pa.array(np.arange(table.num_rows))
+    view = table
+    if filter_model:
+        mask = None
+        for column_name, model in filter_model.items():
+            column_mask = _filter_mask(table[column_name], model)
+            mask = column_mask if mask is None else pc.and_kleene(mask, column_mask)
+        # rows where a condition is null don't pass the filter
+        mask = pc.fill_null(mask, False)
+        view = table.filter(mask)
+        indices = pc.indices_nonzero(mask)
+    if sort_model and view.num_rows:
+        order = pc.sort_indices(
+            view,
+            # nulls last in every key, whichever way it is sorted
+            sort_keys=[
+                (
+                    item["colId"],
+                    "descending" if item["sort"] == "desc" else "ascending",
+                    "at_end",
+                )
+                for item in sort_model
+            ],
+        )
+        indices = pc.take(indices, order)
+
+    with _lock:
+        _remember(_views, key, indices, VIEW_CACHE_SIZE)
+    return indices
+
+
+def get_rows(path, request):
+    # getRowsResponse for a getRowsRequest of an infinite row model grid
+    table = open_table(path)
+    indices = _view_indices(
+        path, table, request.get("sortModel"), request.get("filterModel")
+    )
+    row_count = table.num_rows if indices is None else len(indices)
+
+    start = max(int(request.get("startRow", 0)), 0)
+    end = min(int(request.get("endRow", row_count)), row_count)
+    if start >= end:
+        return {"rowData": [], "rowCount": row_count}
+    if indices is None:
+        block = table.slice(start, end - start)
+    else:
+        block = table.take(indices[start:end])
+    return {"rowData": block.to_pylist(), "rowCount": row_count}
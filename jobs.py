@@ -0,0 +1,382 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+import leaderboard
+import readers
+import storage
+import utils
+
+# Background processing of uploaded files.
+# Each job is a json record in <data folder>/.jobs/, written by the worker as it
+# goes through the stages, so the web process only has to read files to report
+# progress and unfinished jobs survive a server restart.
+# Cancelling drops a marker file that the worker checks between stages.
+# A job either processes a new upload or appends rows to a processed dataset.
+
+JOBS_FOLDER = ".jobs"
+
+# files processed at the same time, None uses every core
+JOB_WORKERS = None
+
+STAGES = ["parse", "label", "roc", "fit", "persist"]
+
+# queued -> running -> done | failed | cancelled
+ACTIVE_STATUSES = ["queued", "running"]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _jobs_dir(data_folder):
+    return os.path.join(data_folder, JOBS_FOLDER)
+
+
+def _record_path(data_folder, job_id):
+    return os.path.join(_jobs_dir(data_folder), job_id + ".json")
+
+
+def _cancel_path(data_folder, job_id):
+    return os.path.join(_jobs_dir(data_folder), job_id + ".cancel")
+
+
+def _write_record(data_folder, record):
+    record["updated"] = time.time()
+    path = _record_path(data_folder, record["id"])
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(path + ".tmp", path)
+
+
+def read_job(data_folder, job_id):
+    try:
+        with open(_record_path(data_folder, job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_jobs(data_folder):
+    # every job record, oldest first
+    jobs_dir = _jobs_dir(data_folder)
+    if not os.path.isdir(jobs_dir):
+        return []
+    records = []
+    for name in os.listdir(jobs_dir):
+        if name.endswith(".json"):
+            record = read_job(data_folder, name[: -len(".json")])
+            if record is not None:
+                records.append(record)
+    return sorted(records, key=lambda record: record["created"])
+
+
+def is_cancelled(data_folder, job_id):
+    return os.path.exists(_cancel_path(data_folder, job_id))
+
+
+def cancel(data_folder, job_id):
+    record = read_job(data_folder, job_id)
+    if record is None or record["status"] not in ACTIVE_STATUSES:
+        return
+    with open(_cancel_path(data_folder, job_id), "w", encoding="utf-8"):
+        pass
+
+
+def process_file(data_folder, filename, fit_options, on_stage=None):
+    # parse, label, roc, fit and persist one uploaded file; on_stage is called with
+    # the name of each stage before it starts
+    on_stage = on_stage or (lambda stage: None)
+    file_dir = os.path.join(data_folder, filename)
+
+    on_stage("parse")
+    # written by store_files, the tsv is only parsed again for folders that were
+    # copied into data/ by hand
+    raw_grid_filepath = os.path.join(file_dir, storage.SAVED_FILE_NAMES["raw data"])
+    if os.path.isfile(raw_grid_filepath):
+        df = pd.read_feather(raw_grid_filepath)
+    else:
+        df = readers.read_tsv(os.path.join(file_dir, filename))
+        storage.write_raw_data(file_dir, df)
+
+    on_stage("label")
+    labeled_data = utils.label_data(df)
+
+    on_stage("roc")
+    roc_curves = utils.make_roc_curve(labeled_data)
+    board = leaderboard.compare_columns(df, roc_curves)
+
+    on_stage("fit")
+    if fit_options.get("lazy"):
+        fitted_params = {}
+    else:
+        fitted_params = utils.fit_params(
+            labeled_data,
+            max_workers=fit_options.get("max_workers"),
+            cache_dir=fit_options.get("cache_dir"),
+            fast=fit_options.get("fast", False),
+        )
+
+    on_stage("persist")
+    storage.save_leaderboard(file_dir, board)
+    storage.save_dataset(file_dir, labeled_data, roc_curves, fitted_params)
+
+
+def _match_types(new_df, raw_df, filename):
+    # the new rows with the column types of the stored ones: blank cells make the
+    # parser guess other types, e.g. float NaN for an empty text column, which would
+    # then be labeled as a numeric column
+    new_df = new_df[raw_df.columns].copy()
+    for column in raw_df.columns:
+        if new_df[column].dtype == raw_df[column].dtype:
+            continue
+        if pd.api.types.is_numeric_dtype(raw_df[column]):
+            # int and float mix, concat gives the column a type that holds both
+            if not pd.api.types.is_numeric_dtype(new_df[column]):
+                raise ValueError(
+                    f"The column {column} of the new rows isn't numeric, "
+                    f"as it is in {filename}."
+                )
+            continue
+        try:
+            new_df[column] = new_df[column].astype(raw_df[column].dtype)
+        except (TypeError, ValueError) as e:
+            raise ValueError(
+                f"The column {column} of the new rows can't be read as "
+                f"{raw_df[column].dtype}, as it is in {filename}: {e}"
+            )
+    return new_df
+
+
+def _stored_rows(labeled_data):
+    # rows of the samples a stored dataset holds, every row is in one group of
+    # every column; None without numeric columns
+    for data in labeled_data.values():
+        return sum(len(data[group]["data"]) for group in utils.SAMPLE_GROUPS)
+    return None
+
+
+def append_file(data_folder, filename, rows_path, fit_options, on_stage=None, state=None):
+    # add the rows of the tsv at rows_path to a processed dataset: the new values are
+    # merged into the stored sorted arrays and only the groups that got new samples
+    # are refitted, starting from their previous parameters.
+    # state is kept in the job record and holds the size of the dataset before the
+    # append, so an append that is run again after an interruption replaces what the
+    # first run stored instead of adding the rows twice
+    on_stage = on_stage or (lambda stage: None)
+    state = state if state is not None else {}
+    file_dir = os.path.join(data_folder, filename)
+    tsv_path = os.path.join(file_dir, filename)
+
+    on_stage("parse")
+    new_df = readers.read_tsv(rows_path)
+    raw_df = pd.read_feather(os.path.join(file_dir, storage.SAVED_FILE_NAMES["raw data"]))
+    if new_df.empty:
+        raise ValueError("The file has no rows to append.")
+    if "rows" not in state:
+        state["rows"] = len(raw_df)
+        state["tsv_size"] = os.path.getsize(tsv_path)
+    # rows an interrupted run already stored
+    raw_df = raw_df.iloc[: state["rows"]]
+    if set(new_df.columns) != set(raw_df.columns):
+        raise ValueError(
+            f"The columns of the new rows {list(new_df.columns)} don't match "
+            f"the columns of {filename} {list(raw_df.columns)}."
+        )
+    same_column_order = list(new_df.columns) == list(raw_df.columns)
+    new_df = _match_types(new_df, raw_df, filename)
+    combined_df = pd.concat([raw_df, new_df], ignore_index=True)
+
+    on_stage("label")
+    labeled_data, roc_curves, fitted_params = storage.load_dataset(file_dir)
+    # an interrupted run may have got as far as saving the merged dataset
+    already_stored = _stored_rows(labeled_data) == len(combined_df)
+    new_labeled_data = utils.label_data(new_df.copy())
+    if already_stored:
+        merged_labeled_data = labeled_data
+    else:
+        merged_labeled_data = utils.append_labeled_data(labeled_data, new_labeled_data)
+
+    on_stage("roc")
+    if already_stored:
+        merged_roc_curves = roc_curves
+    else:
+        merged_roc_curves = {
+            column: utils.append_roc_curve(
+                roc_curves[column], merged_labeled_data[column], new_labeled_data[column]
+            )
+            for column in merged_labeled_data
+        }
+    board = leaderboard.compare_columns(combined_df, merged_roc_curves)
+
+    on_stage("fit")
+    if fitted_params and not already_stored:
+        changed_groups = [
+            (column, group)
+            for column, data in new_labeled_data.items()
+            for group in utils.SAMPLE_GROUPS
+            if len(data[group]["data"])
+        ]
+        fitted_params = utils.update_fit_params(
+            merged_labeled_data,
+            fitted_params,
+            changed_groups,
+            max_workers=fit_options.get("max_workers"),
+            cache_dir=fit_options.get("cache_dir"),
+            fast=fit_options.get("fast", False),
+        )
+
+    on_stage("persist")
+    # each file is replaced whole and the dataset header goes last, the tsv is cut
+    # back to its size before the append, so every step can be run again
+    storage.write_raw_data(file_dir, combined_df)
+    storage.save_leaderboard(file_dir, board)
+    if not already_stored:
+        storage.save_dataset(file_dir, merged_labeled_data, merged_roc_curves, fitted_params)
+    # the tsv stays the full source of the dataset, for reprocessing
+    with open(tsv_path, "rb+") as f:
+        f.truncate(state["tsv_size"])
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    if same_column_order:
+        # the uploaded lines as they are, without their header
+        with open(rows_path, "rb") as f:
+            f.readline()
+            new_lines = f.read()
+        with open(tsv_path, "ab") as f:
+            f.write(new_lines)
+    else:
+        new_df.to_csv(tsv_path, sep="\t", mode="a", header=False, index=False)
+
+
+def _run_job(data_folder, job_id):
+    # runs in a worker process, every outcome ends up in the job record
+    record = read_job(data_folder, job_id)
+    if record is None:
+        return
+
+    def on_stage(stage):
+        if is_cancelled(data_folder, job_id):
+            raise JobCancelled()
+        record["status"] = "running"
+        record["stage"] = stage
+        record["progress"] = STAGES.index(stage) / len(STAGES)
+        _write_record(data_folder, record)
+
+    rows_path = record.get("rows_path")
+    try:
+        if rows_path:
+            append_file(
+                data_folder,
+                record["filename"],
+                rows_path,
+                record["fit_options"],
+                on_stage,
+                record.setdefault("append", {}),
+            )
+        else:
+            process_file(data_folder, record["filename"], record["fit_options"], on_stage)
+        record["status"] = "done"
+        record["progress"] = 1.0
+    except JobCancelled:
+        record["status"] = "cancelled"
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = f"Error processing file {record['filename']}: {e}"
+
+    if rows_path:
+        if os.path.exists(rows_path):
+            os.remove(rows_path)
+    elif record["status"] != "done":
+        # half processed folders would show up as broken datasets
+        shutil.rmtree(os.path.join(data_folder, record["filename"]), ignore_errors=True)
+    if os.path.exists(_cancel_path(data_folder, job_id)):
+        os.remove(_cancel_path(data_folder, job_id))
+    _write_record(data_folder, record)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _on_job_finished(data_folder, job_id, future):
+    # the worker writes its own outcome, this only covers a worker that died
+    if future.cancelled() or future.exception() is None:
+        return
+    record = read_job(data_folder, job_id)
+    if record is not None and record["status"] in ACTIVE_STATUSES:
+        record["status"] = "failed"
+        record["error"] = f"Error processing file {record['filename']}: {future.exception()}"
+        _write_record(data_folder, record)
+    if isinstance(future.exception(), BrokenProcessPool):
+        _reset_executor()
+
+
+def _start(data_folder, job_id):
+    try:
+        future = _get_executor().submit(_run_job, data_folder, job_id)
+    except BrokenProcessPool:
+        _reset_executor()
+        future = _get_executor().submit(_run_job, data_folder, job_id)
+    future.add_done_callback(
+        lambda future: _on_job_finished(data_folder, job_id, future)
+    )
+
+
+def submit(data_folder, filename, fit_options, rows_path=None):
+    # queue the processing of an uploaded file, or with rows_path the append of the
+    # rows in that tsv to the processed file; returns the job id
+    os.makedirs(_jobs_dir(data_folder), exist_ok=True)
+    record = {
+        "id": uuid.uuid4().hex,
+        "filename": filename,
+        "rows_path": rows_path,
+        "fit_options": fit_options,
+        "status": "queued",
+        "stage": None,
+        "progress": 0.0,
+        "error": None,
+        "created": time.time(),
+    }
+    _write_record(data_folder, record)
+    _start(data_folder, record["id"])
+    return record["id"]
+
+
+def resume(data_folder):
+    # requeue the jobs a previous server process left unfinished
+    for record in list_jobs(data_folder):
+        if record["status"] in ACTIVE_STATUSES:
+            _start(data_folder, record["id"])
+
+
+def forget(data_folder, job_id):
+    # drop the record of a finished job
+    for path in [_record_path(data_folder, job_id), _cancel_path(data_folder, job_id)]:
+        if os.path.exists(path):
+            os.remove(path)
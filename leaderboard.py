@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# AUC of every numeric column of a dataset, with its DeLong variance and the DeLong
+# test between every pair of columns, computed together from midranks (the fast
+# DeLong algorithm of Sun and Xu, 2014): the columns are ranked in one call, and the
+# covariance of all the AUCs comes from the placement values of the samples.
+# Columns the roc curves mirror are negated first, so their AUC is the one the roc
+# tab shows.
+
+LEVEL = 0.95
+
+
+def _delong(positive, negative):
+    # AUCs and their covariance for k columns measured on the same samples;
+    # positive is (k, m), negative is (k, n)
+    m = positive.shape[1]
+    n = negative.shape[1]
+    combined_ranks = stats.rankdata(np.hstack([positive, negative]), axis=1)
+    positive_ranks = stats.rankdata(positive, axis=1)
+    negative_ranks = stats.rankdata(negative, axis=1)
+
+    aucs = (combined_ranks[:, :m].sum(axis=1) - m * (m + 1) / 2) / (m * n)
+    # placement of each positive among the negatives and of each negative among
+    # the positives
+    positive_placements = (combined_ranks[:, :m] - positive_ranks) / n
+    negative_placements = 1 - (combined_ranks[:, m:] - negative_ranks) / m
+    covariance = (
+        np.atleast_2d(np.cov(positive_placements)) / m
+        + np.atleast_2d(np.cov(negative_placements)) / n
+    )
+    return aucs, covariance
+
+
+def _p_value(aucs, covariance, i, j):
+    variance = covariance[i, i] + covariance[j, j] - 2 * covariance[i, j]
+    if variance <= 0:
+        return 1.0 if aucs[i] == aucs[j] else 0.0
+    z = (aucs[i] - aucs[j]) / np.sqrt(variance)
+    return float(2 * stats.norm.sf(abs(z)))
+
+
+def compare_columns(df, roc_curves, level=LEVEL):
+    # leaderboard of the labeled numeric columns of df, best AUC first:
+    # {"columns": [{"column", "auc", "variance", "auc_low", "auc_high", "positives",
+    # "negatives", "mirrored"}], "p_values": {column: {column: p}}, "level": level}
+    if "reference_result" not in df.columns:
+        return {"columns": [], "p_values": {}, "level": level}
+    reference = df["reference_result"].fillna(0).to_numpy()
+    columns = [
+        column
+        for column in df.columns
+        if column != "reference_result"
+        and pd.api.types.is_numeric_dtype(df[column])
+        and column in roc_curves
+        and roc_curves[column]["total_positive"] > 0
+        and roc_curves[column]["total_negative"] > 0
+    ]
+    if not columns:
+        return {"columns": [], "p_values": {}, "level": level}
+
+    signs = np.array([-1.0 if roc_curves[column]["mirrored"] else 1.0 for column in columns])
+    values = df[columns].to_numpy(dtype=float).T * signs[:, np.newaxis]
+    # samples missing a value in any column are left out, so the columns are
+    # compared on the same samples
+    complete = ~np.isnan(values).any(axis=0)
+    positive = values[:, (reference > 0) & complete]
+    negative = values[:, (reference < 0) & complete]
+    if positive.shape[1] == 0 or negative.shape[1] == 0:
+        return {"columns": [], "p_values": {}, "level": level}
+    aucs, covariance = _delong(positive, negative)
+
+    z = stats.norm.ppf(1 - (1 - level) / 2)
+    board = []
+    for i, column in enumerate(columns):
+        standard_error = np.sqrt(max(covariance[i, i], 0))
+        board.append(
+            {
+                "column": column,
+                "auc": float(aucs[i]),
+                "variance": float(covariance[i, i]),
+                "auc_low": float(max(aucs[i] - z * standard_error, 0)),
+                "auc_high": float(min(aucs[i] + z * standard_error, 1)),
+                "positives": positive.shape[1],
+                "negatives": negative.shape[1],
+                "mirrored": bool(roc_curves[column]["mirrored"]),
+            }
+        )
+    p_values = {column: {} for column in columns}
+    for i in range(len(columns)):
+        for j in range(i + 1, len(columns)):
+            p_value = _p_value(aucs, covariance, i, j)
+            p_values[columns[i]][columns[j]] = p_value
+            p_values[columns[j]][columns[i]] = p_value
+
+    board.sort(key=lambda row: -row["auc"])
+    return {"columns": board, "p_values": p_values, "level": level}
@@ -364,19 +364,49 @@ layout = dbc.Container(
                                                             id="ag-grid",
                                                             className="ag-theme-balham",
                                                             columnDefs=[],
-                                                            rowData=[],
+                                                            # rows are requested block by block, see grid_source
+                                                            rowModelType="infinite",
                                                             columnSize="autoSize",
                                                             defaultColDef={
                                                                 "resizable": True,
                                                                 "sortable": True,
                                                                 "filter": True,
                                                             },
+                                                            dashGridOptions={
+                                                                "cacheBlockSize": 200,
+                                                                "maxBlocksInCache": 20,
+                                                            },
                                                             # style={
                                                             #     "height": "525px"
                                                             # },  # Set height for the grid
                                                         )
                                                     ],
                                                 ),
+                                                dbc.Tab(
+                                                    label="Leaderboard",
+                                                    children=[
+                                                        # every column of the file by AUC
+                                                        dash_table.DataTable(
+                                                            id="leaderboard-table",
+                                                            columns=[],
+                                                            data=[],
+                                                            sort_action="native",
+                                                            style_table={"overflowX": "auto"},
+                                                            style_cell={"fontSize": "12px"},
+                                                        ),
+                                                        html.Div(
+                                                            "DeLong test p-values between columns",
+                                                            className="mt-3 mb-1 small",
+                                                        ),
+                                                        dash_table.DataTable(
+                                                            id="leaderboard-pvalues",
+                                                            columns=[],
+                                                            data=[],
+                                                            style_table={"overflowX": "auto"},
+                                                            style_cell={"fontSize": "12px"},
+                                                        ),
+                                                    ],
+                                                ),
                                             ],
                                         )
                                     ],
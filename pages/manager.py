@@ -20,13 +20,12 @@ import json
 import os
 import shutil
 
+import dataset_cache
+import grid_source
+import jobs
+import storage
+from storage import SAVED_FILE_NAMES
 
-SAVED_FILE_NAMES = {
-    "roc curves": "roc_curves.pkl",
-    "raw data": "raw_data.feather",
-    "labeled data": "labeled_data.pkl",
-    "parameter fitting": "fitted_params.pkl",
-}
 
 DATA_FOLDER = "data"
 
@@ -40,6 +39,7 @@ dash.register_page(
 layout = dbc.Container(
     children=[
         dcc.Store(id="manage-files-button-click", data={}),
+        dcc.Store(id="viewed-file", data=None),
         dcc.Download(id="download-xlsx"),
         dbc.Col(
             dcc.Upload(
@@ -62,6 +62,39 @@ layout = dbc.Container(
             ),
             width=12,
         ),
+        dbc.Row(
+            [
+                dbc.Col(
+                    dcc.Dropdown(
+                        id="append-target",
+                        placeholder="Append new rows to...",
+                        clearable=True,
+                    ),
+                    width=4,
+                ),
+                dbc.Col(
+                    dcc.Upload(
+                        id="append-data",
+                        multiple=False,
+                        children=html.Div([
+                            "Drop a .tsv with the new rows or ",
+                            html.A("Select File", className="navlink")
+                        ]),
+                        style={
+                            'width': '100%',
+                            'height': '38px',
+                            'lineHeight': '38px',
+                            'borderWidth': '1px',
+                            'borderStyle': 'dashed',
+                            'borderRadius': '5px',
+                            'textAlign': 'center'
+                        },
+                    ),
+                    width=8,
+                ),
+            ],
+            className="mb-2",
+        ),
         dbc.Row(
             [
                 dbc.Col(
@@ -80,6 +113,7 @@ layout = dbc.Container(
                         },
                         columnDefs = [
                             {"field": "filename", "sortable": True, "filter": True, "flex": True},
+                            {"field": "status", "width": 120},
                             {"field": "view",
                              "width": 80,
                              "cellRenderer": "Button",
@@ -104,16 +138,20 @@ layout = dbc.Container(
                         id="file-viewer",
                         className="ag-theme-balham",
                         columnDefs=[],
-                        rowData=[],
+                        # rows are read from the memory-mapped feather on request
+                        rowModelType="infinite",
                         columnSize="autoSize",
                         defaultColDef = {
                             "sortable": True,
                             "filter": True,
                             "resizable": True,
                         },
-                        # dashGridOptions={
-                        #     "rowHeight": 20,
-                        # },
+                        dashGridOptions={
+                            # "rowHeight": 20,
+                            "cacheBlockSize": 100,
+                            "maxBlocksInCache": 10,
+                            "tooltipShowDelay": 0,
+                        },
                     ),
                     width=6,
                 ),
@@ -122,19 +160,51 @@ layout = dbc.Container(
     ]
 )
 
+@callback(
+    Output("append-target", "options"),
+    Input("processed-files-list", "data"),
+)
+def update_append_targets(files):
+    return files or []
+
+
+def job_status_text(job):
+    prefix = "append " if job.get("append") else ""
+    if job["status"] == "queued":
+        return prefix + "queued"
+    return f"{prefix}{job['stage']} {job['progress']:.0%}"
+
+
 @callback(
         Output("manage-files", "rowData"),
         Input("processed-files-list", "data"),
+        Input("jobs-status", "data"),
 )
-def add_files_to_grid(files):
+def add_files_to_grid(files, jobs_status):
+    # a file with a running job is only listed with that job
+    busy_files = {job["filename"] for job in jobs_status or []}
+    files = [f for f in files if f not in busy_files]
     data = {
         "filename": files,
+        "status": ["ready" for f in files],
         "view": ["View" for f in files],
         "download": ["Download" for f in files],
         "delete": ["Delete" for f in files],
+        "job": [None for f in files],
     }
     df = pd.DataFrame(data)
-    return df.to_dict("records")
+    # files still being processed, they can only be cancelled
+    jobs_df = pd.DataFrame(
+        {
+            "filename": [job["filename"] for job in jobs_status or []],
+            "status": [job_status_text(job) for job in jobs_status or []],
+            "view": ["" for job in jobs_status or []],
+            "download": ["" for job in jobs_status or []],
+            "delete": ["Cancel" for job in jobs_status or []],
+            "job": [job["id"] for job in jobs_status or []],
+        }
+    )
+    return pd.concat([df, jobs_df], ignore_index=True).to_dict("records")
 
 
 @callback(
@@ -147,9 +217,19 @@ def save_row_data(n):
     return n
 
 
+def stats_tooltip(stats):
+    lines = [stats["type"], f"missing: {stats['missing']}"]
+    if "distinct" in stats:
+        lines.append(f"distinct: {stats['distinct']}")
+    if "mean" in stats:
+        lines.append(f"min: {stats['min']:.4g}  max: {stats['max']:.4g}")
+        lines.append(f"mean: {stats['mean']:.4g}")
+    return "\n".join(lines)
+
+
 @callback(
         Output("file-viewer", "columnDefs"),
-        Output("file-viewer", "rowData"),
+        Output("viewed-file", "data"),
         Output("download-xlsx", "data"),
         Output("processed-files-list", "data", allow_duplicate=True),
         Input("manage-files-button-click", "data"),
@@ -163,18 +243,30 @@ def button_manager(button_data, row_data, processed_files):
     filename = row_data[row]["filename"]
     filepath = os.path.join(DATA_FOLDER, filename, SAVED_FILE_NAMES["raw data"])
 
+    if row_data[row].get("job"):
+        # the file is still being processed, only cancel applies
+        if action == "delete":
+            jobs.cancel(DATA_FOLDER, row_data[row]["job"])
+        return no_update, no_update, no_update, no_update
+
     out_columnDefs = None
-    out_rowData = None
+    out_viewed_file = None
     out_download = None
 
     match action:
         case "view":
-            df = pd.read_feather(filepath)
-            out_rowData=df.to_dict("records")
+            # only the schema is read here, the grid asks for rows as it scrolls
+            stats = storage.read_raw_data_stats(os.path.join(DATA_FOLDER, filename))
+            column_defs = grid_source.column_defs(filepath)
+            for column_def in column_defs:
+                column_def["headerTooltip"] = stats_tooltip(
+                    stats["columns"][column_def["field"]]
+                )
+            out_viewed_file = filename
             out_columnDefs=[
                         {
-                            "headerName" : filename,
-                            "children" : [{"field": i} for i in df.columns]
+                            "headerName" : f"{filename} ({stats['num_rows']} rows)",
+                            "children" : column_defs
                         }
                     ]
         case "download":
@@ -183,8 +275,34 @@ def button_manager(button_data, row_data, processed_files):
         case "delete":
             processed_files.remove(filename)
             shutil.rmtree(os.path.join(DATA_FOLDER, filename))
+            dataset_cache.invalidate(DATA_FOLDER, filename)
+
+    return out_columnDefs, out_viewed_file, out_download, processed_files
 
-    return out_columnDefs, out_rowData, out_download, processed_files
+
+@callback(
+    Output("file-viewer", "getRowsResponse"),
+    Input("file-viewer", "getRowsRequest"),
+    State("viewed-file", "data"),
+    prevent_initial_call=True,
+)
+def serve_file_viewer_rows(request, filename):
+    filepath = os.path.join(DATA_FOLDER, filename or "", SAVED_FILE_NAMES["raw data"])
+    if not request or not filename or not os.path.isfile(filepath):
+        return {"rowData": [], "rowCount": 0}
+    return grid_source.get_rows(filepath, request)
+
+
+# a newly viewed file must not be shown from the previous file's row blocks
+dash.clientside_callback(
+    """
+    function (columnDefs) {
+        dash_ag_grid.getApiAsync("file-viewer").then((api) => api.purgeInfiniteCache());
+    }
+    """,
+    Input("file-viewer", "columnDefs"),
+    prevent_initial_call=True,
+)
 
 @callback(
     Output('file-viewer', 'columnSize'),
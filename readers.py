@@ -0,0 +1,68 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+# TSV reading shared by the web ingest and the CLI.
+# pyarrow parses blocks of the file on all cores; whatever it refuses (ragged rows,
+# a reference_result that isn't whole numbers, ...) goes through pandas, which either
+# reads it or raises the error the callers already report.
+
+READ_ENGINE = "pyarrow"  # "pyarrow" or "pandas"
+BLOCK_SIZE = 16 * 1024 * 1024  # bytes per parse block, the unit of parallelism
+
+# columns whose type is fixed instead of inferred from the first block; with empty
+# cells reference_result comes back as float, as pandas reads it
+COLUMN_TYPES = {"reference_result": pa.int64()}
+
+
+def _read_tsv_pyarrow(source, columns):
+    table = pacsv.read_csv(
+        source,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=BLOCK_SIZE),
+        parse_options=pacsv.ParseOptions(delimiter="\t"),
+        convert_options=pacsv.ConvertOptions(
+            column_types=COLUMN_TYPES,
+            # empty cells are missing values in every column, as with pandas
+            strings_can_be_null=True,
+            include_columns=columns,
+        ),
+    )
+    # all-empty columns come back untyped, pandas reads them as float NaN
+    for index, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(index, field.name, table[index].cast(pa.float64()))
+    return table.to_pandas()
+
+
+def read_header(path):
+    # column names of a tsv file, without parsing it
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return f.readline().rstrip("\r\n").split("\t")
+
+
+def _has_duplicate_names(source):
+    # pyarrow keeps repeated header names, pandas renames them x, x.1, ...
+    if isinstance(source, io.BytesIO):
+        first_line = source.getvalue().split(b"\n", 1)[0]
+        names = first_line.decode("utf-8-sig", errors="replace").rstrip("\r").split("\t")
+    else:
+        names = read_header(source)
+    return len(set(names)) != len(names)
+
+
+def read_tsv(source, engine=None, columns=None):
+    # DataFrame of a tsv file path or of its raw bytes; columns limits it to those
+    # columns, which must all be in the file
+    engine = engine or READ_ENGINE
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    if engine == "pyarrow" and not _has_duplicate_names(source):
+        try:
+            return _read_tsv_pyarrow(source, columns)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            if isinstance(source, io.BytesIO):
+                source.seek(0)
+    return pd.read_csv(source, sep="\t", usecols=columns)
@@ -0,0 +1,298 @@
+import json
+import os
+import pickle
+import shutil
+import uuid
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import utils
+
+# On-disk layout of a processed dataset, data/<filename>/:
+#   <filename>        the uploaded tsv
+#   raw_data.feather  the parsed file, for the grids and downloads; uncompressed so it
+#                     can be memory-mapped, with per-column stats in its schema metadata
+#   dataset.json      header: columns, per-column scalars, digests of the sample
+#                     groups (the fit_cache keys of their fits) and fitted parameters
+#   leaderboard.json  AUC and DeLong comparison of the columns, see leaderboard.py
+#   arrays.<id>/      one .npy per array, opened memory-mapped so loading a dataset
+#                     only maps the files and touches the pages that get read; with
+#                     the histogram pyramid of every sample group (see utils)
+# The header is written last, a folder without one is not a finished dataset.
+# Every file is written under a temporary name and moved into place, and a save
+# writes a new arrays folder that the header names, so a dataset that is saved again
+# stays readable, and memory-mapped by the app, until the new header replaces the
+# old one.
+
+SAVED_FILE_NAMES = {
+    "raw data": "raw_data.feather",
+    "header": "dataset.json",
+    "arrays": "arrays",
+    "leaderboard": "leaderboard.json",
+}
+
+# pickles written before the columnar format, converted by load_dataset
+LEGACY_FILE_NAMES = {
+    "roc curves": "roc_curves.pkl",
+    "labeled data": "labeled_data.pkl",
+    "parameter fitting": "fitted_params.pkl",
+}
+
+FORMAT_VERSION = 1
+
+STATS_METADATA_KEY = b"column_stats"
+
+ROC_ARRAYS = [
+    "values",
+    "labels",
+    "labeled_values",
+    "accumulated_positive_at_value",
+    "accumulated_negative_at_value",
+    "accumulated_unknown_at_value",
+]
+
+ROC_SCALARS = ["total_positive", "total_negative", "total_unknown", "mirrored"]
+
+
+def _array_path(file_dir, index, name, arrays=SAVED_FILE_NAMES["arrays"]):
+    # columns are numbered, their names can hold anything a tsv header can
+    return os.path.join(file_dir, arrays, f"{index}.{name}.npy")
+
+
+def _arrays_folders(file_dir):
+    # every arrays folder of file_dir, including those of earlier or unfinished saves
+    prefix = SAVED_FILE_NAMES["arrays"]
+    return [
+        name
+        for name in os.listdir(file_dir)
+        if (name == prefix or name.startswith(prefix + "."))
+        and os.path.isdir(os.path.join(file_dir, name))
+    ]
+
+
+def _to_json_number(value):
+    return None if value is None else float(value)
+
+
+def _column_stats(column):
+    stats = {"type": str(column.type), "missing": column.null_count}
+    if pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+        values = column.to_numpy(zero_copy_only=False).astype(np.float64)
+        values = values[~np.isnan(values)]
+        stats["missing"] = len(column) - len(values)
+        if len(values):
+            stats.update(
+                min=float(values.min()),
+                max=float(values.max()),
+                mean=float(values.mean()),
+            )
+    else:
+        stats["distinct"] = len(column.unique())
+    return stats
+
+
+def _table_stats(table):
+    return {
+        "num_rows": table.num_rows,
+        "columns": {name: _column_stats(table[name]) for name in table.column_names},
+    }
+
+
+def write_raw_data(file_dir, df):
+    # the stats are computed once here so previews only need to read the schema
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[STATS_METADATA_KEY] = json.dumps(_table_stats(table)).encode("utf-8")
+    path = os.path.join(file_dir, SAVED_FILE_NAMES["raw data"])
+    feather.write_feather(
+        table.replace_schema_metadata(metadata),
+        path + ".tmp",
+        compression="uncompressed",
+    )
+    os.replace(path + ".tmp", path)
+
+
+def read_raw_data_stats(file_dir):
+    # {"num_rows", "columns": {name: stats}} without reading any column data
+    path = os.path.join(file_dir, SAVED_FILE_NAMES["raw data"])
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        metadata = reader.schema.metadata or {}
+        if STATS_METADATA_KEY in metadata:
+            return json.loads(metadata[STATS_METADATA_KEY])
+        # written before the stats were stored
+        return _table_stats(reader.read_all())
+
+
+def save_dataset(file_dir, labeled_data, roc_curves, fitted_params):
+    arrays = SAVED_FILE_NAMES["arrays"] + "." + uuid.uuid4().hex[:12]
+    os.makedirs(os.path.join(file_dir, arrays))
+
+    columns = []
+    for index, (column, data) in enumerate(labeled_data.items()):
+        roc_data = roc_curves[column]
+        for group in utils.SAMPLE_GROUPS:
+            np.save(
+                _array_path(file_dir, index, group, arrays), np.asarray(data[group]["data"])
+            )
+            np.save(
+                _array_path(file_dir, index, group + "_pyramid", arrays),
+                utils.histogram_pyramid(
+                    data[group]["data"], data["range_min"], data["range_max"]
+                ),
+            )
+        for name in ROC_ARRAYS:
+            np.save(_array_path(file_dir, index, name, arrays), np.asarray(roc_data[name]))
+        columns.append(
+            {
+                "name": column,
+                "range_min": data["range_min"],
+                "range_max": data["range_max"],
+                "total_positive": int(roc_data["total_positive"]),
+                "total_negative": int(roc_data["total_negative"]),
+                "total_unknown": int(roc_data["total_unknown"]),
+                "mirrored": bool(roc_data["mirrored"]),
+                "digests": {
+                    group: utils.group_digest(data[group]) for group in utils.SAMPLE_GROUPS
+                },
+            }
+        )
+
+    header = {
+        "version": FORMAT_VERSION,
+        "arrays": arrays,
+        "columns": columns,
+        "fitted_params": {
+            column: {
+                group: {
+                    dist_name: {
+                        name: _to_json_number(value) for name, value in params.items()
+                    }
+                    for dist_name, params in dists.items()
+                }
+                for group, dists in groups.items()
+            }
+            for column, groups in fitted_params.items()
+        },
+    }
+    header_path = os.path.join(file_dir, SAVED_FILE_NAMES["header"])
+    with open(header_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(header, f)
+    os.replace(header_path + ".tmp", header_path)
+
+    # the arrays of the previous save; mapped files that can't be removed yet
+    # (Windows) go with the next save
+    for name in _arrays_folders(file_dir):
+        if name != arrays:
+            shutil.rmtree(os.path.join(file_dir, name), ignore_errors=True)
+
+
+def save_leaderboard(file_dir, board):
+    # written before the header of the dataset it belongs to
+    path = os.path.join(file_dir, SAVED_FILE_NAMES["leaderboard"])
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(board, f)
+    os.replace(path + ".tmp", path)
+
+
+def read_leaderboard(file_dir):
+    # None for datasets processed before leaderboards were stored
+    try:
+        with open(
+            os.path.join(file_dir, SAVED_FILE_NAMES["leaderboard"]), "r", encoding="utf-8"
+        ) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def has_legacy_pickles(file_dir):
+    return all(
+        os.path.isfile(os.path.join(file_dir, name))
+        for name in LEGACY_FILE_NAMES.values()
+    )
+
+
+def is_processed(file_dir):
+    return os.path.isfile(os.path.join(file_dir, SAVED_FILE_NAMES["header"])) or (
+        has_legacy_pickles(file_dir)
+    )
+
+
+def discard_processed(file_dir):
+    # forget the processed dataset of a folder whose upload is being replaced
+    for name in [
+        SAVED_FILE_NAMES["header"],
+        SAVED_FILE_NAMES["leaderboard"],
+        *LEGACY_FILE_NAMES.values(),
+    ]:
+        path = os.path.join(file_dir, name)
+        if os.path.isfile(path):
+            os.remove(path)
+    for name in _arrays_folders(file_dir):
+        shutil.rmtree(os.path.join(file_dir, name), ignore_errors=True)
+
+
+def migrate_legacy(file_dir):
+    # rewrite a pickle folder in the columnar format; the roc curves are rebuilt from
+    # the labeled data so older roc_curves.pkl layouts don't matter
+    with open(os.path.join(file_dir, LEGACY_FILE_NAMES["labeled data"]), "rb") as f:
+        labeled_data = pickle.load(f)
+    with open(os.path.join(file_dir, LEGACY_FILE_NAMES["parameter fitting"]), "rb") as f:
+        fitted_params = pickle.load(f)
+
+    save_dataset(file_dir, labeled_data, utils.make_roc_curve(labeled_data), fitted_params)
+    for name in LEGACY_FILE_NAMES.values():
+        os.remove(os.path.join(file_dir, name))
+
+
+def load_dataset(file_dir):
+    # (labeled_data, roc_curves, fitted_params) with every array memory-mapped
+    header_path = os.path.join(file_dir, SAVED_FILE_NAMES["header"])
+    if not os.path.isfile(header_path) and has_legacy_pickles(file_dir):
+        migrate_legacy(file_dir)
+
+    with open(header_path, "r", encoding="utf-8") as f:
+        header = json.load(f)
+    # headers saved before the arrays folders were versioned use arrays/
+    arrays = header.get("arrays", SAVED_FILE_NAMES["arrays"])
+
+    labeled_data = {}
+    roc_curves = {}
+    for index, column in enumerate(header["columns"]):
+        name = column["name"]
+        labeled_data[name] = {
+            group: {
+                "data": np.load(_array_path(file_dir, index, group, arrays), mmap_mode="r")
+            }
+            for group in utils.SAMPLE_GROUPS
+        }
+        labeled_data[name]["range_min"] = column["range_min"]
+        labeled_data[name]["range_max"] = column["range_max"]
+        # hashed here once for headers saved before the digests were stored
+        digests = column.get("digests", {})
+        for group in utils.SAMPLE_GROUPS:
+            group_data = labeled_data[name][group]
+            group_data["digest"] = digests.get(group) or utils.group_digest(group_data)
+        for group in utils.SAMPLE_GROUPS:
+            pyramid_path = _array_path(file_dir, index, group + "_pyramid", arrays)
+            if os.path.isfile(pyramid_path):
+                pyramid = np.load(pyramid_path, mmap_mode="r")
+            else:
+                # saved before the pyramids were
+                pyramid = utils.histogram_pyramid(
+                    labeled_data[name][group]["data"],
+                    column["range_min"],
+                    column["range_max"],
+                )
+            labeled_data[name][group]["pyramid"] = pyramid
+
+        roc_curves[name] = {
+            array: np.load(_array_path(file_dir, index, array, arrays), mmap_mode="r")
+            for array in ROC_ARRAYS
+        }
+        roc_curves[name].update({scalar: column[scalar] for scalar in ROC_SCALARS})
+
+    return labeled_data, roc_curves, header["fitted_params"]
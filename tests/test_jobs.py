@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import jobs
+import storage
+import utils
+
+
+def _make_dataset(data_folder, filename, labeled):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "ID": [f"s{i}" for i in range(40)],
+            "score": rng.normal(size=40),
+            "count": rng.integers(0, 100, 40),
+        }
+    )
+    if labeled:
+        df.insert(1, "reference_result", rng.choice([-1, 0, 1], 40))
+    file_dir = os.path.join(data_folder, filename)
+    os.makedirs(file_dir)
+    df.to_csv(os.path.join(file_dir, filename), sep="\t", index=False)
+    jobs.process_file(data_folder, filename, {"lazy": True})
+
+    new_df = df.iloc[:10].copy()
+    new_df["ID"] = [f"n{i}" for i in range(10)]
+    new_df["score"] = rng.normal(size=10)
+    rows_path = os.path.join(data_folder, "rows.tsv")
+    new_df.to_csv(rows_path, sep="\t", index=False)
+    return file_dir, rows_path
+
+
+def _row_counts(file_dir, filename):
+    labeled_data, _, _ = storage.load_dataset(file_dir)
+    stored = {
+        column: sum(len(data[group]["data"]) for group in utils.SAMPLE_GROUPS)
+        for column, data in labeled_data.items()
+    }
+    raw = len(pd.read_feather(os.path.join(file_dir, storage.SAVED_FILE_NAMES["raw data"])))
+    tsv = len(pd.read_csv(os.path.join(file_dir, filename), sep="\t"))
+    return stored, raw, tsv
+
+
+@pytest.mark.parametrize("labeled", [False, True])
+@pytest.mark.parametrize("crash_after_save", [False, True])
+def test_resumed_append_stores_the_rows_once(tmp_path, monkeypatch, labeled, crash_after_save):
+    data_folder = str(tmp_path)
+    filename = "dataset.tsv"
+    file_dir, rows_path = _make_dataset(data_folder, filename, labeled)
+
+    # the first run dies during persist, before or right after the header is saved
+    save_dataset = storage.save_dataset
+
+    def interrupted_save(*args, **kwargs):
+        if crash_after_save:
+            save_dataset(*args, **kwargs)
+        raise RuntimeError("interrupted")
+
+    state = {}
+    monkeypatch.setattr(storage, "save_dataset", interrupted_save)
+    with pytest.raises(RuntimeError):
+        jobs.append_file(data_folder, filename, rows_path, {"lazy": True}, state=state)
+    monkeypatch.setattr(storage, "save_dataset", save_dataset)
+
+    jobs.append_file(data_folder, filename, rows_path, {"lazy": True}, state=state)
+
+    stored, raw, tsv = _row_counts(file_dir, filename)
+    assert raw == tsv == 50
+    assert stored == {"score": 50, "count": 50}
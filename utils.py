@@ -1,11 +1,22 @@
 import numpy as np
-from scipy import stats
+from scipy import optimize, stats
 import plotly.graph_objects as go
 import pandas as pd
 import bisect
 import math
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache, partial
 from dash import dash_table
 
+# imported as a top-level module by the app and as part of the package by the cli
+try:
+    from . import fit_cache
+except ImportError:
+    import fit_cache
+
 # from app import THRESHOLD
 
 THRESHOLD = "#d47500"
@@ -53,199 +64,663 @@ def label_data(df):
     return labeled_data
 
 
-def calculate_bin_edges(range_value, range_min, range_max):
-    num_bins_on_screen = 100
+# histogram pyramid of a sample group: counts over [range_min, range_max] in
+# HISTOGRAM_BASE_BINS equal bins, then every coarser power-of-two level down to one
+# bin, all levels in one array; built when a dataset is saved so the main graph
+# can histogram any visible range without going over the samples
+HISTOGRAM_BASE_BINS = 4096
+HISTOGRAM_BINS_ON_SCREEN = 100
+
+
+def histogram_pyramid(data, range_min, range_max):
+    counts = np.histogram(data, bins=HISTOGRAM_BASE_BINS, range=(range_min, range_max))[0]
+    levels = [counts]
+    while levels[-1].size > 1:
+        levels.append(levels[-1].reshape(-1, 2).sum(axis=1))
+    return np.concatenate(levels)
+
+
+def _pyramid_level(pyramid, level):
+    # counts of one level, level 0 being the finest
+    start = 2 * HISTOGRAM_BASE_BINS - (2 * HISTOGRAM_BASE_BINS >> level)
+    return pyramid[start : start + (HISTOGRAM_BASE_BINS >> level)]
+
+
+def base_histogram(group_data, range_min, range_max):
+    # (bin centers, counts) of the finest level of a group's pyramid
+    pyramid = group_data.get("pyramid")
+    if pyramid is None:
+        pyramid = histogram_pyramid(group_data["data"], range_min, range_max)
+    width = (range_max - range_min) / HISTOGRAM_BASE_BINS
+    centers = range_min + (np.arange(HISTOGRAM_BASE_BINS) + 0.5) * width
+    return centers, np.asarray(_pyramid_level(pyramid, 0))
+
+
+def visible_histogram(group_data, range_min, range_max, range_value):
+    # (bin centers, densities, bin widths) of the bins in range_value, about
+    # HISTOGRAM_BINS_ON_SCREEN of them; densities are normalized over every sample
+    # like np.histogram(density=True)
+    data = group_data["data"]
+    pyramid = group_data.get("pyramid")
+    base_width = (range_max - range_min) / HISTOGRAM_BASE_BINS
+    target_width = (range_value[1] - range_value[0]) / HISTOGRAM_BINS_ON_SCREEN
+    if len(data) == 0 or target_width <= 0:
+        return np.array([]), np.array([]), np.array([])
+
+    if pyramid is None or target_width < base_width:
+        # zoomed in past the base level: exact counts of the visible bins, the data is
+        # sorted so that is one binary search per edge
+        start = np.floor(range_value[0] / target_width) * target_width
+        edges = np.arange(start, range_value[1] + target_width, target_width)
+        counts = np.diff(np.searchsorted(data, edges, side="left"))
+        width = target_width
+    else:
+        level = min(
+            int(np.log2(target_width / base_width)), int(np.log2(HISTOGRAM_BASE_BINS))
+        )
+        width = base_width * 2**level
+        level_counts = _pyramid_level(pyramid, level)
+        first = max(int(np.floor((range_value[0] - range_min) / width)), 0)
+        last = min(int(np.ceil((range_value[1] - range_min) / width)), level_counts.size)
+        counts = np.asarray(level_counts[first:last])
+        edges = range_min + np.arange(first, max(last, first) + 1) * width
 
-    visible_range_width = range_value[1] - range_value[0]
-    step = visible_range_width / num_bins_on_screen
+    widths = np.full(counts.size, width)
+    centers = edges[: counts.size] + width / 2
+    return centers, counts / (len(data) * width), widths
 
-    start = np.floor(range_min / step) * step
-    stop = np.ceil(range_max / step) * step
 
-    bin_edges = np.arange(start, stop + step, step)
-    return bin_edges
+# parameter names of each distribution, in the order scipy's fit() returns them
+DISTRIBUTIONS = {
+    "norm": ["loc", "scale"],
+    "gompertz": ["c", "loc", "scale"],
+    "expon": ["loc", "scale"],
+    "exponnorm": ["K", "loc", "scale"],
+}
 
+SAMPLE_GROUPS = ["positive", "negative", "unknown"]
 
-def fit_params(labeled_data):
-    fitted_data = {}
-    for column, data in labeled_data.items():
-        positive_data = data["positive"]["data"]
-        negative_data = data["negative"]["data"]
-        unknown_data = data["unknown"]["data"]
-
-        # Initialize all parameters to None
-        pnl, pns, pgc, pgl, pgs, pel, pes, penk, penl, pens = (
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-        )
-        nnl, nns, ngc, ngl, ngs, nel, nes, nenk, nenl, nens = (
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-        )
-        unl, uns, ugc, ugl, ugs, uel, ues, uenk, uenl, uens = (
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-            None,
-        )
 
-        if positive_data.size > 0:
-            pnl, pns = stats.norm.fit(positive_data)
-            pgc, pgl, pgs = stats.gompertz.fit(positive_data)
-            pel, pes = stats.expon.fit(positive_data)
-            penk, penl, pens = stats.exponnorm.fit(positive_data)
-        if negative_data.size > 0:
-            nnl, nns = stats.norm.fit(negative_data)
-            ngc, ngl, ngs = stats.gompertz.fit(negative_data)
-            nel, nes = stats.expon.fit(negative_data)
-            nenk, nenl, nens = stats.exponnorm.fit(negative_data)
-        if unknown_data.size > 0:
-            unl, uns = stats.norm.fit(unknown_data)
-            ugc, ugl, ugs = stats.gompertz.fit(unknown_data)
-            uel, ues = stats.expon.fit(unknown_data)
-            uenk, uenl, uens = stats.exponnorm.fit(unknown_data)
-
-        fitted_data[column] = {
-            "positive": {
-                "norm": {
-                    "loc": pnl,
-                    "scale": pns,
-                },  #                'r-squared': None, 'aic': None, 'bic': None},
-                "gompertz": {"c": pgc, "loc": pgl, "scale": pgs},
-                "expon": {
-                    "loc": pel,
-                    "scale": pes,
-                },  #                'r-squared': None, 'aic': None, 'bic': None},
-                "exponnorm": {"K": penk, "loc": penl, "scale": pens},
-            },  # 'r-squared': None, 'aic': None, 'bic': None}},
-            "negative": {
-                "norm": {
-                    "loc": nnl,
-                    "scale": nns,
-                },  #                'r-squared': None, 'aic': None, 'bic': None},
-                "gompertz": {"c": ngc, "loc": ngl, "scale": ngs},
-                "expon": {
-                    "loc": nel,
-                    "scale": nes,
-                },  #                'r-squared': None, 'aic': None, 'bic': None},
-                "exponnorm": {"K": nenk, "loc": nenl, "scale": nens},
-            },  # 'r-squared': None, 'aic': None, 'bic': None}},
-            "unknown": {
-                "norm": {
-                    "loc": unl,
-                    "scale": uns,
-                },  #                'r-squared': None, 'aic': None, 'bic': None},
-                "gompertz": {"c": ugc, "loc": ugl, "scale": ugs},
-                "expon": {
-                    "loc": uel,
-                    "scale": ues,
-                },  #                'r-squared': None, 'aic': None, 'bic': None},
-                "exponnorm": {"K": uenk, "loc": uenl, "scale": uens},
-            },  # , 'r-squared': None, 'aic': None, 'bic': None}}
+def has_fit(params):
+    # False for groups without data and for fits that failed
+    return bool(params) and all(value is not None for value in params.values())
+
+
+# evaluated fit overlays of the main graph, shared by every dataset: a curve only
+# depends on the distribution, its parameters and the x grid it is drawn on
+PDF_POINTS = 300
+CURVE_CACHE_SIZE = 256
+
+
+def _params_key(params):
+    return tuple(sorted((name, float(value)) for name, value in params.items()))
+
+
+@lru_cache(maxsize=CURVE_CACHE_SIZE)
+def _frozen_distribution(dist_name, params_key):
+    return getattr(stats, dist_name)(**dict(params_key))
+
+
+def frozen_distribution(dist_name, params):
+    # scipy distribution frozen at fitted params, reused by every caller
+    return _frozen_distribution(dist_name, _params_key(params))
+
+
+@lru_cache(maxsize=CURVE_CACHE_SIZE)
+def _pdf_curve(dist_name, params_key, x_min, x_max, points):
+    x = np.linspace(x_min, x_max, points)
+    pdf = _frozen_distribution(dist_name, params_key).pdf(x)
+    # the arrays are handed to every caller asking for the same curve
+    x.setflags(write=False)
+    pdf.setflags(write=False)
+    return x, pdf
+
+
+def pdf_curve(dist_name, params, x_range, points=PDF_POINTS):
+    # (x, pdf) on points evenly spaced x over x_range
+    return _pdf_curve(
+        dist_name, _params_key(params), float(x_range[0]), float(x_range[1]), points
+    )
+
+
+@lru_cache(maxsize=CURVE_CACHE_SIZE)
+def _ppf(dist_name, params_key, q):
+    return float(_frozen_distribution(dist_name, params_key).ppf(q))
+
+
+def ppf(dist_name, params, q):
+    return _ppf(dist_name, _params_key(params), float(q))
+
+
+# fast fits: groups larger than this are first fitted on a stratified subsample,
+# and the refit on every sample is capped at this many optimizer iterations
+FAST_FIT_SUBSAMPLE = 5000
+FAST_FIT_REFINE_ITERATIONS = 50
+
+
+def _initial_guess(dist_name, data):
+    # moment-based starting point as (shape args, loc, scale) for the distributions
+    # scipy fits with a numerical optimizer; None for the ones with closed-form MLEs
+    mean = data.mean()
+    std = data.std()
+    if std == 0 or not np.isfinite(std):
+        return None
+    if dist_name == "gompertz":
+        # the standard gompertz with c=1 has mean e * E1(1) ~= 0.596
+        loc = data.min() - 1e-3 * std
+        return (1.0,), loc, (mean - loc) / 0.596
+    if dist_name == "exponnorm":
+        # mean = mu + tau, var = sigma^2 + tau^2, skewness = 2 tau^3 / std^3
+        skewness = np.clip(stats.skew(data), 0.01, 1.99)
+        tau = std * (skewness / 2) ** (1 / 3)
+        sigma = np.sqrt(max(std**2 - tau**2, (0.01 * std) ** 2))
+        return (tau / sigma,), mean - tau, sigma
+    return None
+
+
+def _split_params(fitted):
+    return tuple(fitted[:-2]), fitted[-2], fitted[-1]
+
+
+def _capped_fmin(func, x0, args=(), disp=0):
+    # scipy's default fit optimizer, stopped early since x0 is already close
+    return optimize.fmin(
+        func, x0, args=args, disp=disp, maxiter=FAST_FIT_REFINE_ITERATIONS
+    )
+
+
+def _fast_fit(dist, data, subsample_size):
+    guess = _initial_guess(dist.name, data)
+    if guess is None:
+        return dist.fit(data)
+
+    shapes, loc, scale = guess
+    if data.size <= subsample_size:
+        return dist.fit(data, *shapes, loc=loc, scale=scale)
+
+    # groups are sorted, so evenly spaced picks are a quantile-stratified subsample
+    picks = np.linspace(0, data.size - 1, subsample_size).round().astype(int)
+    shapes, loc, scale = _split_params(
+        dist.fit(data[picks], *shapes, loc=loc, scale=scale)
+    )
+    # refine on every sample, starting from the subsample estimate
+    return dist.fit(data, *shapes, loc=loc, scale=scale, optimizer=_capped_fmin)
+
+
+def _fit_distribution(
+    dist_name, data, fast=False, subsample_size=FAST_FIT_SUBSAMPLE, start=None
+):
+    # one MLE fit; runs in a worker process, a failed fit leaves every parameter None.
+    # start: parameters of an earlier fit to the same group, used as starting point
+    param_names = DISTRIBUTIONS[dist_name]
+    dist = getattr(stats, dist_name)
+    data = np.asarray(data, dtype=float)
+    try:
+        if has_fit(start):
+            shapes, loc, scale = _split_params([start[name] for name in param_names])
+            fitted = dist.fit(
+                data,
+                *shapes,
+                loc=loc,
+                scale=scale,
+                **({"optimizer": _capped_fmin} if fast else {}),
+            )
+        elif fast:
+            fitted = _fast_fit(dist, data, subsample_size)
+        else:
+            fitted = dist.fit(data)
+    except Exception:
+        return dict.fromkeys(param_names)
+    return dict(zip(param_names, fitted))
+
+
+def fit_report(labeled_data, columns=None, subsample_size=FAST_FIT_SUBSAMPLE):
+    # exact vs fast fit of every (column, group, distribution): wall time of each and
+    # the log-likelihood the fast parameters give up (loglik_gap > 0 means worse fit)
+    rows = []
+    for column in columns if columns is not None else labeled_data:
+        for group in SAMPLE_GROUPS:
+            data = np.asarray(labeled_data[column][group]["data"], dtype=float)
+            if data.size == 0:
+                continue
+            for dist_name in DISTRIBUTIONS:
+                dist = getattr(stats, dist_name)
+                row = {"column": column, "group": group, "distribution": dist_name}
+                row["n"] = data.size
+                for mode, fast in (("exact", False), ("fast", True)):
+                    start = time.perf_counter()
+                    params = _fit_distribution(dist_name, data, fast, subsample_size)
+                    row[f"{mode}_seconds"] = time.perf_counter() - start
+                    row[f"{mode}_loglik"] = (
+                        dist.logpdf(data, **params).sum() if has_fit(params) else np.nan
+                    )
+                # no gap to report when the exact fit itself is degenerate
+                row["loglik_gap"] = (
+                    row["exact_loglik"] - row["fast_loglik"]
+                    if np.isfinite(row["exact_loglik"])
+                    else np.nan
+                )
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def group_digest(group_data):
+    # fit_cache.data_digest of a sample group; loaded datasets carry it (see
+    # storage), so looking a fit up on every redraw doesn't hash the samples again
+    digest = group_data.get("digest")
+    if digest is None:
+        digest = fit_cache.data_digest(group_data["data"])
+    return digest
+
+
+def _fit_tasks(labeled_data, columns=None, fast=False, groups=None):
+    # fit_cache key -> (distribution, samples, [(column, group), ...]); identical
+    # sample groups share one key, so each distinct fit runs at most once.
+    # groups: only these (column, group) pairs instead of every group of columns
+    if groups is None:
+        groups = [
+            (column, group)
+            for column in (columns if columns is not None else labeled_data)
+            for group in SAMPLE_GROUPS
+        ]
+    tasks = {}
+    for column, group in groups:
+        group_data = np.asarray(labeled_data[column][group]["data"], dtype=float)
+        if group_data.size == 0:
+            continue
+        digest = group_digest(labeled_data[column][group])
+        for dist_name in DISTRIBUTIONS:
+            key = fit_cache.fit_key(dist_name, digest, fast)
+            task = tasks.setdefault(key, (dist_name, group_data, []))
+            task[2].append((column, group))
+    return tasks
+
+
+def _run_fits(tasks, max_workers=None, cache_dir=None, fast=False, starts=None):
+    # fit_cache key -> params for every task, from the cache where possible.
+    # starts: fit_cache key -> earlier parameters to start that fit from
+    starts = starts or {}
+    results = {}
+    pending = []
+    for key in tasks:
+        params = fit_cache.get(cache_dir, key) if cache_dir else None
+        if params is not None:
+            results[key] = params
+        else:
+            pending.append(key)
+
+    fitted = {}
+    if max_workers == 1 or len(pending) <= 1:
+        for key in pending:
+            fitted[key] = _fit_distribution(
+                tasks[key][0], tasks[key][1], fast, start=starts.get(key)
+            )
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    _fit_distribution,
+                    tasks[key][0],
+                    tasks[key][1],
+                    fast,
+                    start=starts.get(key),
+                ): key
+                for key in pending
+            }
+            for future in as_completed(futures):
+                try:
+                    fitted[futures[future]] = future.result()
+                except Exception:
+                    # e.g. a worker died; keep the None parameters for this fit only
+                    fitted[futures[future]] = dict.fromkeys(
+                        DISTRIBUTIONS[tasks[futures[future]][0]]
+                    )
+
+    if cache_dir:
+        for key, params in fitted.items():
+            if has_fit(params):
+                fit_cache.put(cache_dir, key, params)
+        if fitted:
+            fit_cache.evict(cache_dir)
+    results.update(fitted)
+    return results
+
+
+def fit_params(labeled_data, max_workers=None, cache_dir=None, fast=False):
+    # fitted_data[column][group][distribution] -> {param: value}, all None when the
+    # group is empty or the fit failed. Every distinct (samples, distribution) fit is
+    # its own task on a process pool; max_workers=1 fits serially in this process.
+    # With cache_dir, fits are looked up in and saved to the persistent fit cache.
+    # fast=True seeds the optimizer with moment estimates and fits large groups on a
+    # subsample first (see fit_report for the time/likelihood tradeoff).
+    fitted_data = {
+        column: {
+            group: {
+                dist_name: dict.fromkeys(param_names)
+                for dist_name, param_names in DISTRIBUTIONS.items()
+            }
+            for group in SAMPLE_GROUPS
+        }
+        for column in labeled_data
+    }
+
+    tasks = _fit_tasks(labeled_data, fast=fast)
+    for key, params in _run_fits(tasks, max_workers, cache_dir, fast).items():
+        dist_name, _, targets = tasks[key]
+        for column, group in targets:
+            fitted_data[column][group][dist_name] = dict(params)
+    return fitted_data
+
+
+def update_fit_params(
+    labeled_data, fitted_params, groups, max_workers=None, cache_dir=None, fast=False
+):
+    # fit_params after samples were added to the (column, group) pairs in groups:
+    # the other groups keep their parameters, the changed ones are refitted starting
+    # from their previous parameters, which converges in a few iterations
+    fitted_data = {
+        column: {
+            group: {
+                dist_name: dict(dists.get(dist_name) or dict.fromkeys(param_names))
+                for dist_name, param_names in DISTRIBUTIONS.items()
+            }
+            for group, dists in (
+                (group, fitted_params.get(column, {}).get(group, {}))
+                for group in SAMPLE_GROUPS
+            )
         }
+        for column in labeled_data
+    }
+
+    tasks = _fit_tasks(labeled_data, fast=fast, groups=groups)
+    starts = {}
+    for key, (dist_name, _, targets) in tasks.items():
+        column, group = targets[0]
+        starts[key] = fitted_data[column][group][dist_name]
+    for key, params in _run_fits(tasks, max_workers, cache_dir, fast, starts).items():
+        dist_name, _, targets = tasks[key]
+        for column, group in targets:
+            fitted_data[column][group][dist_name] = dict(params)
     return fitted_data
 
 
+# Lazy fitting: fits computed on demand are memoized per process by fit_cache key.
+# Keys being fitted by a background prefetch map to that prefetch's Future. Prefetches
+# are speculative: a new prefetch cancels the queued ones of the previous selection,
+# and get_fit runs a fit itself rather than wait for a prefetch that hasn't started.
+_FIT_MEMO = {}
+_PENDING_FITS = {}
+_FIT_LOCK = threading.Lock()
+_prefetch_executor = None
+
+
+def get_fit(
+    labeled_data, fitted_params, column, group, dist_name, cache_dir=None, fast=False
+):
+    # parameters of one fit: taken from fitted_params when present, otherwise
+    # computed the first time they are asked for and memoized
+    params = (fitted_params or {}).get(column, {}).get(group, {}).get(dist_name)
+    if has_fit(params):
+        return params
+
+    group_data = np.asarray(labeled_data[column][group]["data"], dtype=float)
+    if group_data.size == 0:
+        return dict.fromkeys(DISTRIBUTIONS[dist_name])
+    key = fit_cache.fit_key(dist_name, group_digest(labeled_data[column][group]), fast)
+
+    with _FIT_LOCK:
+        pending = _PENDING_FITS.get(key)
+    # a prefetch still queued behind others is cancelled and the fit runs here
+    if pending is not None and not pending.cancel():
+        try:
+            pending.result()
+        except Exception:
+            pass
+
+    with _FIT_LOCK:
+        if key in _FIT_MEMO:
+            return _FIT_MEMO[key]
+
+    task = {key: (dist_name, group_data, [(column, group)])}
+    params = _run_fits(task, max_workers=1, cache_dir=cache_dir, fast=fast)[key]
+    with _FIT_LOCK:
+        _FIT_MEMO[key] = params
+    return params
+
+
+def _finish_prefetch(key, cache_dir, future):
+    try:
+        params = future.result()
+    except Exception:
+        params = None
+    with _FIT_LOCK:
+        if _PENDING_FITS.get(key) is future:
+            del _PENDING_FITS[key]
+        if params is not None:
+            _FIT_MEMO[key] = params
+    if cache_dir and has_fit(params):
+        fit_cache.put(cache_dir, key, params)
+
+
+def cancel_prefetches():
+    # drop the queued prefetches no worker has started yet; cancelling runs
+    # _finish_prefetch, which forgets them
+    with _FIT_LOCK:
+        futures = list(_PENDING_FITS.values())
+    for future in futures:
+        future.cancel()
+
+
+def prefetch_fits(
+    labeled_data, fitted_params, column, max_workers=None, cache_dir=None, fast=False
+):
+    # start every missing fit of column on a background process pool and return
+    # right away; get_fit waits for a fit that is still running instead of refitting.
+    # The queued prefetches of an earlier column or dataset are cancelled first
+    global _prefetch_executor
+
+    cancel_prefetches()
+    tasks = _fit_tasks(labeled_data, columns=[column], fast=fast)
+    for key, (dist_name, group_data, targets) in tasks.items():
+        if all(
+            has_fit((fitted_params or {}).get(c, {}).get(g, {}).get(dist_name))
+            for c, g in targets
+        ):
+            continue
+        with _FIT_LOCK:
+            if key in _FIT_MEMO or key in _PENDING_FITS:
+                continue
+        params = fit_cache.get(cache_dir, key) if cache_dir else None
+        if params is not None:
+            with _FIT_LOCK:
+                _FIT_MEMO[key] = params
+            continue
+
+        with _FIT_LOCK:
+            if _prefetch_executor is None:
+                _prefetch_executor = ProcessPoolExecutor(max_workers=max_workers)
+            try:
+                future = _prefetch_executor.submit(
+                    _fit_distribution, dist_name, group_data, fast
+                )
+            except BrokenProcessPool:
+                # a worker died earlier; start a fresh pool for later prefetches
+                _prefetch_executor = None
+                return
+            _PENDING_FITS[key] = future
+        future.add_done_callback(partial(_finish_prefetch, key, cache_dir))
+
+
+def _empty_roc_curve():
+    return {
+        "values": np.array([], dtype=float),
+        "labels": np.array([], dtype=np.int8),
+        "labeled_values": np.array([], dtype=float),
+        "total_positive": 0,
+        "total_negative": 0,
+        "total_unknown": 0,
+        "accumulated_positive_at_value": np.array([], dtype=np.int32),
+        "accumulated_negative_at_value": np.array([], dtype=np.int32),
+        "accumulated_unknown_at_value": np.array([], dtype=np.int32),
+        "mirrored": False,
+    }
+
+
 # mistitled, more like count labels at each point
 def make_roc_curve(labeled_data):
     # view confusion matrix chart @ https://en.wikipedia.org/wiki/Receiver_operating_characteristic
+    #
+    # Each column is stored as parallel arrays sorted by value:
+    #   values  -> float64 sample values
+    #   labels  -> int8, 1 = positive, -1 = negative, 0 = unknown (same as reference_result)
+    #   labeled_values -> values without the unknowns, still sorted
+    #   accumulated_*_at_value[k] -> number of samples of that label in values[: k + 1]
     roc_curves = {}
     for column, data in labeled_data.items():
-        positive_data = data["positive"]["data"]
-        negative_data = data["negative"]["data"]
-        unknown_data = data["unknown"]["data"]
-
-        pos_median = np.median(positive_data)
-        neg_median = np.median(negative_data)
-        mirrored = pos_median <= neg_median
-
-        # if mirrored:
-        #     positive_data = -positive_data
-        #     negative_data = -negative_data
-        #     unknown_data = -unknown_data
-
-        total_positive = len(positive_data)
-        total_negative = len(negative_data)
-        total_unknown = len(unknown_data)
-
-        if total_positive == 0 and total_positive == 0:
-            roc_curves[column] = {
-                "population_data": [],
-                "total_positive": 0,
-                "total_negative": 0,
-                "total_unknown": 0,
-                "accumulated_positive_at_value": [],
-                "accumulated_negative_at_value": [],
-                "accumulated_unknown_at_value": [],
-                "mirrored": False,
-            }
-            continue
+        positive_data = np.asarray(data["positive"]["data"], dtype=float)
+        negative_data = np.asarray(data["negative"]["data"], dtype=float)
+        unknown_data = np.asarray(data["unknown"]["data"], dtype=float)
 
-        # make list of formated data values: tuple (value, True/False)
-        positive_tuples = [(value, True) for value in positive_data]
-        negative_tuples = [(value, False) for value in negative_data]
-        unknown_tuples = [(value, None) for value in unknown_data]
+        total_positive = positive_data.size
+        total_negative = negative_data.size
+        total_unknown = unknown_data.size
 
-        # create a sorted master list of all categories
-        population_data = sorted(
-            positive_tuples + negative_tuples + unknown_tuples, key=lambda x: x[0]
-        )
+        if total_positive == 0 and total_negative == 0:
+            roc_curves[column] = _empty_roc_curve()
+            continue
 
-        current_positive_count = 0
-        current_negative_count = 0
-        current_unknown_count = 0
+        # median of an empty group is nan, which never compares as mirrored
+        mirrored = (
+            total_positive > 0
+            and total_negative > 0
+            and np.median(positive_data) <= np.median(negative_data)
+        )
 
-        accumulated_positive_at_value = []
-        accumulated_negative_at_value = []
-        accumulated_unknown_at_value = []
+        values = np.concatenate([positive_data, negative_data, unknown_data])
+        labels = np.concatenate(
+            [
+                np.ones(total_positive, dtype=np.int8),
+                np.full(total_negative, -1, dtype=np.int8),
+                np.zeros(total_unknown, dtype=np.int8),
+            ]
+        )
 
-        for value, label in population_data:
-            if label is True:
-                current_positive_count += 1
-            elif label is False:
-                current_negative_count += 1
-            elif label is None:
-                current_unknown_count += 1
+        # stable sort keeps positives before negatives before unknowns on ties
+        order = np.argsort(values, kind="stable")
+        values = values[order]
+        labels = labels[order]
 
-            accumulated_positive_at_value.append(current_positive_count)
-            accumulated_negative_at_value.append(current_negative_count)
-            accumulated_unknown_at_value.append(current_unknown_count)
+        count_dtype = np.int32 if values.size < np.iinfo(np.int32).max else np.int64
 
         roc_curves[column] = {
-            "population_data": population_data,
+            "values": values,
+            "labels": labels,
+            "labeled_values": values[labels != 0],
             "total_positive": total_positive,
             "total_negative": total_negative,
             "total_unknown": total_unknown,
-            "accumulated_positive_at_value": accumulated_positive_at_value,
-            "accumulated_negative_at_value": accumulated_negative_at_value,
-            "accumulated_unknown_at_value": accumulated_unknown_at_value,
-            "mirrored": mirrored,
+            "accumulated_positive_at_value": np.cumsum(labels == 1, dtype=count_dtype),
+            "accumulated_negative_at_value": np.cumsum(labels == -1, dtype=count_dtype),
+            "accumulated_unknown_at_value": np.cumsum(labels == 0, dtype=count_dtype),
+            "mirrored": bool(mirrored),
         }
     return roc_curves
 
 
+def append_labeled_data(labeled_data, new_labeled_data):
+    # labeled_data with the samples of new_labeled_data (label_data of the new rows)
+    # merged into each sorted group; only the insertion points are searched for
+    if set(new_labeled_data) != set(labeled_data):
+        raise ValueError(
+            "The numeric columns of the new rows don't match the dataset: "
+            f"{sorted(new_labeled_data)} instead of {sorted(labeled_data)}"
+        )
+    merged = {}
+    for column, data in labeled_data.items():
+        new_data = new_labeled_data[column]
+        merged[column] = {}
+        for group in SAMPLE_GROUPS:
+            old_values = np.asarray(data[group]["data"], dtype=float)
+            new_values = np.asarray(new_data[group]["data"], dtype=float)
+            merged[column][group] = {
+                "data": np.insert(
+                    old_values, np.searchsorted(old_values, new_values), new_values
+                )
+            }
+        merged[column]["range_min"] = min(data["range_min"], new_data["range_min"])
+        merged[column]["range_max"] = max(data["range_max"], new_data["range_max"])
+    return merged
+
+
+def append_roc_curve(roc_data, labeled_column, new_labeled_column):
+    # make_roc_curve of labeled_column (already merged, see append_labeled_data) from
+    # the roc of the old samples and the new samples, without sorting the old ones
+    if roc_data["total_positive"] == 0 and roc_data["total_negative"] == 0:
+        # the old roc is empty and holds no values to merge into
+        return make_roc_curve({"column": labeled_column})["column"]
+
+    new_groups = [
+        np.asarray(new_labeled_column[group]["data"], dtype=float)
+        for group in SAMPLE_GROUPS
+    ]
+    new_values = np.concatenate(new_groups)
+    new_labels = np.concatenate(
+        [
+            np.full(group.size, label, dtype=np.int8)
+            for group, label in zip(new_groups, [1, -1, 0])
+        ]
+    )
+    order = np.argsort(new_values, kind="stable")
+    new_values = new_values[order]
+    new_labels = new_labels[order]
+
+    # ties are ordered positives, negatives, unknowns: a new sample goes after the
+    # equal old samples, minus those of a label that sorts after its own
+    values = roc_data["values"]
+    left = np.searchsorted(values, new_values, side="left")
+    right = np.searchsorted(values, new_values, side="right")
+
+    def tied(label):
+        accumulated = roc_data[f"accumulated_{label}_at_value"]
+        return _accumulated_before(accumulated, right) - _accumulated_before(
+            accumulated, left
+        )
+
+    tied_negative = tied("negative")
+    tied_unknown = tied("unknown")
+    positions = right - np.where(
+        new_labels == 1,
+        tied_negative + tied_unknown,
+        np.where(new_labels == -1, tied_unknown, 0),
+    )
+
+    values = np.insert(values, positions, new_values)
+    labels = np.insert(roc_data["labels"], positions, new_labels)
+    total_positive = int(roc_data["total_positive"]) + new_groups[0].size
+    total_negative = int(roc_data["total_negative"]) + new_groups[1].size
+    total_unknown = int(roc_data["total_unknown"]) + new_groups[2].size
+
+    mirrored = (
+        total_positive > 0
+        and total_negative > 0
+        and np.median(labeled_column["positive"]["data"])
+        <= np.median(labeled_column["negative"]["data"])
+    )
+    count_dtype = np.int32 if values.size < np.iinfo(np.int32).max else np.int64
+    return {
+        "values": values,
+        "labels": labels,
+        "labeled_values": values[labels != 0],
+        "total_positive": total_positive,
+        "total_negative": total_negative,
+        "total_unknown": total_unknown,
+        "accumulated_positive_at_value": np.cumsum(labels == 1, dtype=count_dtype),
+        "accumulated_negative_at_value": np.cumsum(labels == -1, dtype=count_dtype),
+        "accumulated_unknown_at_value": np.cumsum(labels == 0, dtype=count_dtype),
+        "mirrored": bool(mirrored),
+    }
+
+
 no_fig = go.Figure()
 no_fig.add_annotation(
     text="No Data",
@@ -259,118 +734,102 @@ no_fig.add_annotation(
 no_fig.update_layout(xaxis={"visible": False}, yaxis={"visible": False})
 
 
-def plot_roc_curve(roc_data, threshold_index, cli):
-    population_data = roc_data["population_data"]
-    total_positive = roc_data["total_positive"]
-    total_negative = roc_data["total_negative"]
-    acc_pos = roc_data["accumulated_positive_at_value"]
-    acc_neg = roc_data["accumulated_negative_at_value"]
-    mirrored = roc_data["mirrored"]
-
-
-    TPR_plot = [1]
-    FPR_plot = [0]
-    threshold_plot = [population_data[0][0]]
-
-    if total_positive == 0 and total_negative == 0:
-        return no_fig
-
-    for k, pop in enumerate(population_data):
-        positives_less_than_current_value = acc_pos[k - 1] if k > 0 else 0
-        negatives_less_than_current_value = acc_neg[k - 1] if k > 0 else 0
+def _accumulated_before(accumulated, index):
+    # count of samples in values[:index], for one insertion point or an array of them
+    accumulated = np.asarray(accumulated)
+    index = np.asarray(index)
+    if accumulated.size == 0:
+        return np.zeros(index.shape, dtype=int)
+    return np.where(index > 0, accumulated[np.maximum(index - 1, 0)], 0)
 
-        tp_at_k = total_positive - positives_less_than_current_value
-        fp_at_k = total_negative - negatives_less_than_current_value
 
-        tpr_at_k = tp_at_k / total_positive if total_positive > 0 else 0
-        fpr_at_k = 1 - (fp_at_k / total_negative) if total_negative > 0 else 0
-
-        TPR_plot.append(tpr_at_k)
-        FPR_plot.append(fpr_at_k)
-        threshold_plot.append(pop[0])
+def _rates_at_index(roc_data, index):
+    # (TPR, TNR) when everything from values[index] upward is called positive
+    total_positive = roc_data["total_positive"]
+    total_negative = roc_data["total_negative"]
+    positives_below = _accumulated_before(roc_data["accumulated_positive_at_value"], index)
+    negatives_below = _accumulated_before(roc_data["accumulated_negative_at_value"], index)
 
-    TPR_plot.append(0)
-    FPR_plot.append(1)
+    tpr = (
+        (total_positive - positives_below) / total_positive
+        if total_positive > 0
+        else np.zeros(np.shape(index))
+    )
+    tnr = (
+        negatives_below / total_negative
+        if total_negative > 0
+        else np.zeros(np.shape(index))
+    )
+    return tpr, tnr
 
-    if mirrored:
-        _mirrored_TPR_plot = [1-p for p in TPR_plot]
-        _mirrored_FPR_plot = [1-p for p in FPR_plot]
-        TPR_plot = _mirrored_TPR_plot
-        FPR_plot = _mirrored_FPR_plot
 
-        threshold_plot.append(population_data[-1][0])
+def threshold_point(roc_data, threshold_index):
+    # (TNR, TPR, threshold) of the roc marker, for the index gen_roc_table returns
+    values = roc_data["values"]
+    threshold_index = min(max(int(threshold_index), 0), len(values))
+    tpr, tnr = _rates_at_index(roc_data, threshold_index)
+    if roc_data["mirrored"]:
+        tpr, tnr = 1 - tpr, 1 - tnr
+    return float(tnr), float(tpr), float(values[min(threshold_index, len(values) - 1)])
 
-        thresh_pt_x = 0
-        thresh_pt_y = 0
 
-        if total_positive == 0 and total_negative == 0:
-            pass
-        elif threshold_index == len(population_data):
-            thresh_pt_x = 0
-            thresh_pt_y = 1
-        elif threshold_index == 0:
-            thresh_pt_x = 1
-            thresh_pt_y = 0
-        else:
-            thresh_pt_x = FPR_plot[threshold_index+1]
-            thresh_pt_y = TPR_plot[threshold_index+1]
+def plot_roc_curve(roc_data, threshold_index, cli):
+    values = np.asarray(roc_data["values"], dtype=float)
+    total_positive = roc_data["total_positive"]
+    total_negative = roc_data["total_negative"]
+    mirrored = roc_data["mirrored"]
 
-        threshold = population_data[threshold_index][0]
+    if total_positive == 0 and total_negative == 0:
+        return no_fig, None, mirrored
 
+    # one ROC vertex per distinct labeled value; unknowns and ties never move the curve
+    labeled_values = np.asarray(roc_data["labeled_values"], dtype=float)
+    thresholds = labeled_values[np.diff(labeled_values, prepend=-np.inf) != 0]
+    tpr, tnr = _rates_at_index(roc_data, np.searchsorted(values, thresholds, side="left"))
 
-    else:
-        threshold_plot.append(population_data[-1][0])
+    # past the largest value every sample is called negative
+    TPR_plot = np.append(tpr, 0.0)
+    TNR_plot = np.append(tnr, 1.0)
+    threshold_plot = np.append(thresholds, values[-1])
 
-        thresh_pt_x = 0
-        thresh_pt_y = 0
+    thresh_pt_x, thresh_pt_y, threshold = threshold_point(roc_data, threshold_index)
 
-        if total_positive == 0 and total_negative == 0:
-            pass
-        elif threshold_index == len(population_data):
-            thresh_pt_x = 1
-            thresh_pt_y = 0
-        elif threshold_index == 0:
-            thresh_pt_x = 0
-            thresh_pt_y = 1
-        else:
-            thresh_pt_x = FPR_plot[threshold_index + 1]
-            thresh_pt_y = TPR_plot[threshold_index + 1]
-
-        threshold = population_data[threshold_index][0]
+    if mirrored:
+        TPR_plot = 1 - TPR_plot
+        TNR_plot = 1 - TNR_plot
 
     # export x vs y as dataframe
 
     fig = go.Figure()
-    if FPR_plot and TPR_plot:  # Ensure lists are not empty
-        fig.add_trace(
-            go.Scatter(
-                x=FPR_plot,
-                y=TPR_plot,
-                mode="lines",
-                line_shape="hv",
-                name="ROC Curve",
-                customdata=threshold_plot,
-                hovertemplate="Threshold: <b>%{customdata:.2f}</b><br>"
-                + "Sensitivity (TPR): %{y:.2f}<br>"
-                + "Specificity (1-FPR): %{x:.2f}",
-            )
+    fig.add_trace(
+        go.Scatter(
+            x=TNR_plot,
+            y=TPR_plot,
+            mode="lines",
+            line_shape="hv",
+            name="ROC Curve",
+            customdata=threshold_plot,
+            hovertemplate="Threshold: <b>%{customdata:.2f}</b><br>"
+            + "Sensitivity (TPR): %{y:.2f}<br>"
+            + "Specificity (1-FPR): %{x:.2f}",
         )
-        fig.add_trace(
-            go.Scatter(
-                x=[thresh_pt_x],
-                y=[thresh_pt_y],
-                mode="markers",
-                marker=dict(color=THRESHOLD, size=15, symbol="circle"),
-                name="Threshold Point",
-                customdata=[threshold],
-                hovertemplate="Threshold: <b>%{customdata:.2f}</b><br>"
-                + "Sensitivity (TPR): %{y:.2f}<br>"
-                + "Specificity (1-FPR): %{x:.2f}",
-            )
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=[float(thresh_pt_x)],
+            y=[float(thresh_pt_y)],
+            mode="markers",
+            marker=dict(color=THRESHOLD, size=15, symbol="circle"),
+            name="Threshold Point",
+            customdata=[threshold],
+            hovertemplate="Threshold: <b>%{customdata:.2f}</b><br>"
+            + "Sensitivity (TPR): %{y:.2f}<br>"
+            + "Specificity (1-FPR): %{x:.2f}",
         )
-        df = None
-        if cli:
-            df = pd.DataFrame({"TNR(x)": FPR_plot, "TPR(y)": TPR_plot, "threshold": threshold_plot})
+    )
+    df = None
+    if cli:
+        df = pd.DataFrame({"TNR(x)": TNR_plot, "TPR(y)": TPR_plot, "threshold": threshold_plot})
     return fig, df, mirrored
 
 
@@ -378,6 +837,10 @@ def bisect_population_w_threshold(pop_data, threshold_value, mirrored):
     # bisect_left returns an insertion point `i` such that all `a[k]` for `k < i` have `a[k] < x`.
     # And all `a[k]` for `k >= i` have `a[k] >= x`.
     # This `i` directly tells us how many elements are strictly less than `threshold_value`.
+    # Both branches are O(log n) and never copy pop_data: sorted arrays from make_roc_curve
+    # go through np.searchsorted, plain lists (e.g. after a dcc.Store round trip) through bisect.
+    if isinstance(pop_data, np.ndarray):
+        return int(np.searchsorted(pop_data, threshold_value, side="left"))
     index = bisect.bisect_left(pop_data, threshold_value)
     return index
 
@@ -386,17 +849,14 @@ def gen_roc_table(roc_data, threshold_value, norm_params):
         # Return an empty figure or a figure with a message if data is not available
         return None
 
-    population_data = roc_data["population_data"]
+    population_data = roc_data["values"]
     accumulated_positive_at_value = roc_data["accumulated_positive_at_value"]
     accumulated_negative_at_value = roc_data["accumulated_negative_at_value"]
     accumulated_unknown_at_value = roc_data["accumulated_unknown_at_value"]
     mirrored = roc_data["mirrored"]
 
-
-    pop_data = [p[0] for p in population_data]  #  if p[1] is not None]
-    i = bisect_population_w_threshold(pop_data, threshold_value, mirrored)
-    pop_data = [p[0] for p in population_data if p[1] is not None]
-    i_without_unknown = bisect_population_w_threshold(pop_data, threshold_value, mirrored)
+    # values are sorted once in make_roc_curve, so this is the only lookup needed
+    i = bisect_population_w_threshold(population_data, threshold_value, mirrored)
 
     # if mirrored:
     #     # population_data.reverse()
@@ -412,9 +872,9 @@ def gen_roc_table(roc_data, threshold_value, norm_params):
         tn_val = 0
         un_val = 0
     else:
-        fn_val = accumulated_positive_at_value[i - 1]
-        tn_val = accumulated_negative_at_value[i - 1]
-        un_val = accumulated_unknown_at_value[i - 1]
+        fn_val = int(accumulated_positive_at_value[i - 1])
+        tn_val = int(accumulated_negative_at_value[i - 1])
+        un_val = int(accumulated_unknown_at_value[i - 1])
 
     # Determine counts of samples *at or above* the threshold (classified as Positive)
     tp_val = (
@@ -468,7 +928,11 @@ def gen_roc_table(roc_data, threshold_value, norm_params):
 
     mean = norm_params["loc"]
     std = norm_params["scale"]
-    z_score = (threshold_value - mean) / std if std != 0 else float("nan")
+    z_score = (
+        (threshold_value - mean) / std
+        if has_fit(norm_params) and std != 0
+        else float("nan")
+    )
     z_score = round(z_score, 2)
     try:
         ppv = tp_val / (tp_val + fp_val)
@@ -513,3 +977,113 @@ def gen_roc_table(roc_data, threshold_value, norm_params):
     columns = [{"name": i, "id": i} for i in df.columns]
 
     return data, columns, i
+
+
+def threshold_arrays(roc_data, norm_params):
+    # what the clientside threshold callback needs to redo gen_roc_table and move the
+    # roc marker in the browser: the distinct values and, for each, how many samples
+    # of every label lie below it (the last entry holds the totals)
+    values = np.asarray(roc_data["values"], dtype=float)
+    if values.size == 0:
+        return None
+    first_of_value = np.flatnonzero(np.diff(values, prepend=-np.inf) != 0)
+    below = np.append(first_of_value, values.size)
+    return {
+        "values": values[first_of_value].tolist(),
+        "positive_below": _accumulated_before(
+            roc_data["accumulated_positive_at_value"], below
+        ).tolist(),
+        "negative_below": _accumulated_before(
+            roc_data["accumulated_negative_at_value"], below
+        ).tolist(),
+        "unknown_below": _accumulated_before(
+            roc_data["accumulated_unknown_at_value"], below
+        ).tolist(),
+        "total_positive": int(roc_data["total_positive"]),
+        "total_negative": int(roc_data["total_negative"]),
+        "total_unknown": int(roc_data["total_unknown"]),
+        "mirrored": bool(roc_data["mirrored"]),
+        "norm": dict(norm_params) if has_fit(norm_params) else None,
+    }
+
+
+SWEEP_COLUMNS = [
+    "threshold",
+    "TP",
+    "TN",
+    "FP",
+    "FN",
+    "sensitivity",
+    "specificity",
+    "PPV",
+    "NPV",
+    "accuracy",
+    "youden_j",
+    "LR+",
+    "LR-",
+]
+
+
+def threshold_sweep(roc_data):
+    # Confusion matrix and metrics at every distinct cutoff of a make_roc_curve column,
+    # one row per threshold, using the same convention as gen_roc_table: a sample is
+    # called positive at value >= threshold (value < threshold when mirrored).
+    # The last row (threshold=inf) calls every sample negative (positive when mirrored).
+    if not roc_data or (roc_data["total_positive"] == 0 and roc_data["total_negative"] == 0):
+        return pd.DataFrame(columns=SWEEP_COLUMNS)
+
+    values = np.asarray(roc_data["values"], dtype=float)
+    labeled_values = np.asarray(roc_data["labeled_values"], dtype=float)
+    total_positive = roc_data["total_positive"]
+    total_negative = roc_data["total_negative"]
+
+    thresholds = np.append(
+        labeled_values[np.diff(labeled_values, prepend=-np.inf) != 0], np.inf
+    )
+    index = np.searchsorted(values, thresholds, side="left")
+
+    fn = _accumulated_before(roc_data["accumulated_positive_at_value"], index)
+    tn = _accumulated_before(roc_data["accumulated_negative_at_value"], index)
+    tp = total_positive - fn
+    fp = total_negative - tn
+    if roc_data["mirrored"]:
+        tp, fn = fn, tp
+        fp, tn = tn, fp
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sensitivity = tp / total_positive
+        specificity = tn / total_negative
+        sweep = pd.DataFrame(
+            {
+                "threshold": thresholds,
+                "TP": tp,
+                "TN": tn,
+                "FP": fp,
+                "FN": fn,
+                "sensitivity": sensitivity,
+                "specificity": specificity,
+                "PPV": tp / (tp + fp),
+                "NPV": tn / (tn + fn),
+                "accuracy": (tp + tn) / (total_positive + total_negative),
+                "youden_j": sensitivity + specificity - 1,
+                "LR+": sensitivity / (1 - specificity),
+                "LR-": (1 - sensitivity) / specificity,
+            }
+        )
+    return sweep
+
+
+def best_threshold(sweep, criterion="youden_j"):
+    # row of threshold_sweep with the highest value of criterion (any metric column)
+    scores = sweep[criterion].replace([np.inf, -np.inf], np.nan)
+    if scores.isna().all():
+        return None
+    return sweep.loc[scores.idxmax()]
+
+
+def sensitivity_at_specificity(sweep, specificity):
+    # most sensitive row of threshold_sweep that still reaches the given specificity
+    eligible = sweep[sweep["specificity"] >= specificity]
+    if eligible.empty:
+        return None
+    return eligible.loc[eligible["sensitivity"].idxmax()]